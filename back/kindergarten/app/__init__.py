@@ -1,11 +1,21 @@
 from flask import Flask
+from werkzeug.middleware.proxy_fix import ProxyFix
 from flask_sqlalchemy import SQLAlchemy
 from config import config_map
 from app import teacher, user, admin
 from .models import db
+from .cache import init_cache
+from .auth import init_token_cache
+from .password import init_password_hasher
+from .ratelimit import init_login_limiter
+from .jsonprovider import init_json_provider
+from .compression import init_compression
+from .migrations import init_migrations
+from .student_count import init_student_count
+from .database import init_pool_options, init_database
 # import pymysql
 
-# 实例化一个我们需要的redis对象存储缓存数据
+# 缓存（进程内/本机SQLite/redis）在 create_app 中按配置初始化
 
 
 def create_app(dev_name):
@@ -17,8 +27,21 @@ def create_app(dev_name):
     app = Flask(__name__)
     config_class = config_map.get(dev_name)
     app.config.from_object(config_class)  # 从类中读取需要的信息
+    if app.config.get("PROXY_FIX_X_FOR"):
+        # 只信任最近 N 层代理追加的 X-Forwarded-For，request.remote_addr 为客户端真实IP
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=app.config["PROXY_FIX_X_FOR"])
 
+    init_pool_options(app)  # 连接池记录取连接的等待时间
     db.init_app(app)  # 实例化的数据库 配置信息
+    init_database(app)  # 数据库连接设置（SQLite PRAGMA、MySQL 语句超时、连接池统计）
+    init_migrations(app)  # 数据库迁移（flask migrate 命令，开发环境启动时自动执行）
+    init_student_count(app)  # 班级人数校正命令
+    init_json_provider(app)  # JSON 编码（orjson/msgspec/标准库）
+    init_cache(app)  # 缓存
+    init_token_cache(app)  # token 验证缓存
+    init_password_hasher(app)  # 密码哈希进程池
+    init_login_limiter(app)  # 登录失败限流
+    init_compression(app)  # 响应压缩
 
     # 绑定包里面的蓝图对象
     app.register_blueprint(teacher.teacher, url_prefix="/teacher")
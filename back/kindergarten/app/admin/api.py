@@ -1,28 +1,30 @@
 from datetime import datetime
 from flask import request, jsonify
 from . import admin
-from ..models import db, Teacher, Class, Child, Parent, TeacherClass, Admin
+from ..models import db, Teacher, Class, Child, Parent, TeacherClass, ChildLatestDq
 from sqlalchemy import select
-from ..auth import verify_token_and_get_user # 导入验证函数
+from ..auth import require_role, invalidate_teacher_classes, ADMIN_DENIED  # 导入鉴权装饰器
+from ..ratelimit import login_limiter
+from ..catalog import reload_catalogs
+from ..versions import conditional, bump_version
+from ..pagination import fetch_page
+from ..roster import class_roster, invalidate_roster
+from ..database import pool_stats
+from ..replica import read_replica
+
+# 管理端接口只允许管理员访问
+admin_required = require_role("admin", unauthorized=ADMIN_DENIED, forbidden=ADMIN_DENIED)
 
 
 @admin.route("/getChildInfo", methods=["GET"])
+@admin_required
+@conditional("child", "class")
+@read_replica
 def getChildInfo():
     """
-    查询所有学生列表
+    查询所有学生列表，可选 limit/cursor 按 child_id 分页
     """
     try:
-        # --- Token验证逻辑 ---
-        manager_id = request.args.get('manager_id')
-        uniquetoken = request.args.get('uniquetoken')
-
-        if not all([manager_id, uniquetoken]):
-            return jsonify({"code": 400, "message": "缺少必要参数"})
-
-        user, role = verify_token_and_get_user(manager_id, uniquetoken)
-        if not user or role != 'admin':
-            return jsonify({"code": 403, "message": "Token无效或权限不足"})
-        # --- 验证结束 ---
         stmt = select(
             Child.child_id,
             Child.child_name,
@@ -32,7 +34,7 @@ def getChildInfo():
         ).join(Class, Child.class_id == Class.class_id)
 
         # Execute the query
-        result = db.session.execute(stmt).all()
+        result, next_cursor = fetch_page(stmt, [Child.child_id])
 
         # Convert result to list of dictionaries
         children = []
@@ -48,7 +50,8 @@ def getChildInfo():
         return jsonify({
             "code": 200,
             "message": "success",
-            "data": children
+            "data": children,
+            "next_cursor": next_cursor
         })
 
     except Exception as e:
@@ -60,22 +63,13 @@ def getChildInfo():
 
 
 @admin.route("/teacherList", methods=["GET"])
+@admin_required
+@conditional("teacher")
 def getTeacherList():
     """
-    查询所有教师列表
+    查询所有教师列表，可选 limit/cursor 按 teacher_id 分页
     """
     try:
-        # --- Token验证逻辑 ---
-        manager_id = request.args.get('manager_id')
-        uniquetoken = request.args.get('uniquetoken')
-
-        if not all([manager_id, uniquetoken]):
-            return jsonify({"code": 400, "message": "缺少必要参数"})
-
-        user, role = verify_token_and_get_user(manager_id, uniquetoken)
-        if not user or role != 'admin':
-            return jsonify({"code": 403, "message": "Token无效或权限不足"})
-        # --- 验证结束 ---
         # 查询所有教师
         stmt = select(
             Teacher.teacher_id,
@@ -83,7 +77,7 @@ def getTeacherList():
             Teacher.role  # 用于判断是否拥有高级权限
         )
 
-        result = db.session.execute(stmt).all()
+        result, next_cursor = fetch_page(stmt, [Teacher.teacher_id])
 
         # 转换结果为所需格式
         teachers = []
@@ -100,7 +94,8 @@ def getTeacherList():
         return jsonify({
             "code": 200,
             "message": "success",
-            "data": teachers
+            "data": teachers,
+            "next_cursor": next_cursor
         })
 
     except Exception as e:
@@ -112,26 +107,18 @@ def getTeacherList():
 
 
 @admin.route("/classList", methods=["GET"])
+@admin_required
+@conditional("class", "child")
 def getClassList():
     """
     查询所有班级列表
     """
     try:
-        # --- Token验证逻辑 ---
-        manager_id = request.args.get('manager_id')
-        uniquetoken = request.args.get('uniquetoken')
-
-        if not all([manager_id, uniquetoken]):
-            return jsonify({"code": 400, "message": "缺少必要参数"})
-
-        user, role = verify_token_and_get_user(manager_id, uniquetoken)
-        if not user or role != 'admin':
-            return jsonify({"code": 403, "message": "Token无效或权限不足"})
-        # --- 验证结束 ---
         # 查询所有班级
         stmt = select(
             Class.class_id,
-            Class.class_name
+            Class.class_name,
+            Class.student_count
         )
 
         result = db.session.execute(stmt).all()
@@ -141,7 +128,8 @@ def getClassList():
         for row in result:
             classes.append({
                 "class_id": row.class_id,
-                "class_name": row.class_name
+                "class_name": row.class_name,
+                "student_count": row.student_count
             })
 
         return jsonify({
@@ -159,22 +147,12 @@ def getClassList():
 
 
 @admin.route("/classDetail", methods=["GET"])
+@admin_required
 def getClassDetail():
     """
     查询班级详情
     """
     try:
-        # --- Token验证逻辑 ---
-        manager_id = request.args.get('manager_id')
-        uniquetoken = request.args.get('uniquetoken')
-
-        if not all([manager_id, uniquetoken]):
-            return jsonify({"code": 400, "message": "缺少必要参数"})
-
-        user, role = verify_token_and_get_user(manager_id, uniquetoken)
-        if not user or role != 'admin':
-            return jsonify({"code": 403, "message": "Token无效或权限不足"})
-        # --- 验证结束 ---
         class_id = request.args.get('class_id')
         if not class_id:
             return jsonify({
@@ -183,48 +161,24 @@ def getClassDetail():
                 "data": None
             })
 
-        # 查询班级信息
-        class_info = Class.query.get(class_id)
-        if not class_info:
+        # 班级信息、教师和学生（缓存的花名册）
+        roster = class_roster(class_id)
+        if not roster:
             return jsonify({
                 "code": 400,
                 "message": "班级不存在",
                 "data": None
             })
 
-        # 查询班级教师
-        teacher_stmt = select(
-            Teacher.teacher_id,
-            Teacher.teacher_name
-        ).join(TeacherClass, Teacher.teacher_id == TeacherClass.teacher_id
-               ).where(TeacherClass.class_id == class_id)
-
-        teachers = []
-        for row in db.session.execute(teacher_stmt).all():
-            teachers.append({
-                "teacher_id": row.teacher_id,
-                "name": row.teacher_name
-            })
-
-        # 查询班级学生
-        student_stmt = select(
-            Child.child_id,
-            Child.child_name
-        ).where(Child.class_id == class_id)
-
-        students = []
-        for row in db.session.execute(student_stmt).all():
-            students.append({
-                "student_id": row.child_id,
-                "name": row.child_name
-            })
+        teachers = [{"teacher_id": teacher_id, "name": name} for teacher_id, name in roster["teachers"]]
+        students = [{"student_id": child_id, "name": name} for child_id, name, _ in roster["students"]]
 
         return jsonify({
             "code": 200,
             "message": "success",
             "data": {
-                "class_id": class_info.class_id,
-                "class_name": class_info.class_name,
+                "class_id": roster["class_id"],
+                "class_name": roster["class_name"],
                 "teachers": teachers,
                 "students": students
             }
@@ -239,22 +193,12 @@ def getClassDetail():
 
 
 @admin.route("/teacherDetail", methods=["GET"])
+@admin_required
 def getTeacherDetail():
     """
     查询教师详情
     """
     try:
-        # --- Token验证逻辑 ---
-        manager_id = request.args.get('manager_id')
-        uniquetoken = request.args.get('uniquetoken')
-
-        if not all([manager_id, uniquetoken]):
-            return jsonify({"code": 400, "message": "缺少必要参数"})
-
-        user, role = verify_token_and_get_user(manager_id, uniquetoken)
-        if not user or role != 'admin':
-            return jsonify({"code": 403, "message": "Token无效或权限不足"})
-        # --- 验证结束 ---
         teacher_id = request.args.get('teacher_id')
         if not teacher_id:
             return jsonify({
@@ -310,22 +254,12 @@ def getTeacherDetail():
 
 
 @admin.route("/childDetail", methods=["GET"])
+@admin_required
 def getChildDetail():
     """
     查询儿童详情
     """
     try:
-        # --- Token验证逻辑 ---
-        manager_id = request.args.get('manager_id')
-        uniquetoken = request.args.get('uniquetoken')
-
-        if not all([manager_id, uniquetoken]):
-            return jsonify({"code": 400, "message": "缺少必要参数"})
-
-        user, role = verify_token_and_get_user(manager_id, uniquetoken)
-        if not user or role != 'admin':
-            return jsonify({"code": 403, "message": "Token无效或权限不足"})
-        # --- 验证结束 ---
         child_id = request.args.get('child_id')
         if not child_id:
             return jsonify({
@@ -374,22 +308,12 @@ def getChildDetail():
 
 
 @admin.route("/createClass", methods=["POST"])
+@admin_required
 def createClass():
     """
     创建班级
     """
     try:
-        # --- Token验证逻辑 ---
-        manager_id = request.args.get('manager_id')
-        uniquetoken = request.args.get('uniquetoken')
-
-        if not all([manager_id, uniquetoken]):
-            return jsonify({"code": 400, "message": "缺少必要参数"})
-
-        user, role = verify_token_and_get_user(manager_id, uniquetoken)
-        if not user or role != 'admin':
-            return jsonify({"code": 403, "message": "Token无效或权限不足"})
-        # --- 验证结束 ---
         data = request.get_json()
         if not data:
             return jsonify({
@@ -460,6 +384,9 @@ def createClass():
             db.session.add(relation)
 
         db.session.commit()
+        invalidate_teacher_classes(*teacher_ids)
+        invalidate_roster(new_class.class_id)
+        bump_version("class", "teacher_class")
 
         return jsonify({
             "code": 0,
@@ -480,22 +407,12 @@ def createClass():
         })
 
 @admin.route("/deleteClass", methods=["POST"])
+@admin_required
 def deleteClass():
     """
     删除班级
     """
     try:
-        # --- Token验证逻辑 ---
-        manager_id = request.args.get('manager_id')
-        uniquetoken = request.args.get('uniquetoken')
-
-        if not all([manager_id, uniquetoken]):
-            return jsonify({"code": 400, "message": "缺少必要参数"})
-
-        user, role = verify_token_and_get_user(manager_id, uniquetoken)
-        if not user or role != 'admin':
-            return jsonify({"code": 403, "message": "Token无效或权限不足"})
-        # --- 验证结束 ---
         # 获取请求数据
         data = request.get_json()
         if not data:
@@ -505,27 +422,17 @@ def deleteClass():
         if 'manager_id' not in data or 'class_id' not in data:
             return jsonify({"code": 400, "message": "缺少必要参数", "data": None})
 
-        manager_id = data['manager_id']
         class_id = data['class_id']
 
-        # 检查是否为管理员或园长
-        manager_admin = Admin.query.get(manager_id)
-        manager_teacher = Teacher.query.get(manager_id)
-        has_permission = False
-        if manager_admin:
-            has_permission = True
-        elif manager_teacher and manager_teacher.role in ["园长", "管理级教师"]:
-            has_permission = True
-
-        if not has_permission:
-            return jsonify({"code": 400, "message": "没有操作权限", "data": None})
-
         # 查找班级
         class_info = Class.query.get(class_id)
         if not class_info:
             return jsonify({"code": 400, "message": "班级不存在", "data": None})
 
         # 删除班级内的学生
+        ChildLatestDq.query.filter(
+            ChildLatestDq.child_id.in_(select(Child.child_id).where(Child.class_id == class_id))
+        ).delete(synchronize_session=False)
         Child.query.filter_by(class_id=class_id).delete()
 
         # 删除班级与教师的关联
@@ -534,6 +441,9 @@ def deleteClass():
         # 删除班级
         db.session.delete(class_info)
         db.session.commit()
+        invalidate_teacher_classes()
+        invalidate_roster(class_id)
+        bump_version("class", "child", "teacher_class")
 
         return jsonify({"code": 200, "message": "班级删除成功", "data": {"class_id": class_id}})
 
@@ -542,22 +452,12 @@ def deleteClass():
         return jsonify({"code": 400, "message": f"服务器错误: {str(e)}", "data": None})
 
 @admin.route("/addTeacherToClass", methods=["POST"])
+@admin_required
 def addTeacherToClass():
     """
     为班级添加教师
     """
     try:
-        # --- Token验证逻辑 ---
-        manager_id = request.args.get('manager_id')
-        uniquetoken = request.args.get('uniquetoken')
-
-        if not all([manager_id, uniquetoken]):
-            return jsonify({"code": 400, "message": "缺少必要参数"})
-
-        user, role = verify_token_and_get_user(manager_id, uniquetoken)
-        if not user or role != 'admin':
-            return jsonify({"code": 403, "message": "Token无效或权限不足"})
-        # --- 验证结束 ---
         data = request.get_json()
         if not data or not data.get('class_id') or not data.get('teacher_id'):
             return jsonify({
@@ -610,6 +510,9 @@ def addTeacherToClass():
 
         db.session.add(new_relation)
         db.session.commit()
+        invalidate_teacher_classes(teacher_id)
+        invalidate_roster(class_id)
+        bump_version("teacher_class")
 
         return jsonify({
             "code": 200,
@@ -630,22 +533,12 @@ def addTeacherToClass():
 
 
 @admin.route("/removeTeacherFromClass", methods=["POST"])
+@admin_required
 def removeTeacherFromClass():
     """
     为班级删除教师
     """
     try:
-        # --- Token验证逻辑 ---
-        manager_id = request.args.get('manager_id')
-        uniquetoken = request.args.get('uniquetoken')
-
-        if not all([manager_id, uniquetoken]):
-            return jsonify({"code": 400, "message": "缺少必要参数"})
-
-        user, role = verify_token_and_get_user(manager_id, uniquetoken)
-        if not user or role != 'admin':
-            return jsonify({"code": 403, "message": "Token无效或权限不足"})
-        # --- 验证结束 ---
         data = request.get_json()
         if not data or not data.get('class_id') or not data.get('teacher_id'):
             return jsonify({
@@ -673,6 +566,9 @@ def removeTeacherFromClass():
         # 删除关联
         db.session.delete(relation)
         db.session.commit()
+        invalidate_teacher_classes(teacher_id)
+        invalidate_roster(class_id)
+        bump_version("teacher_class")
 
         return jsonify({
             "code": 200,
@@ -690,3 +586,63 @@ def removeTeacherFromClass():
             "message": f"错误: {str(e)}",
             "data": None
         })
+
+
+@admin.route("/loginLimiterStats", methods=["GET"])
+@admin_required
+def getLoginLimiterStats():
+    """
+    查询登录限流的命中/放行次数（当前worker），用于调整限流阈值
+    """
+    try:
+        return jsonify({
+            "code": 200,
+            "message": "success",
+            "data": login_limiter.stats()
+        })
+
+    except Exception as e:
+        return jsonify({
+            "code": 400,
+            "message": f"错误: {str(e)}",
+            "data": None
+        })
+
+
+@admin.route("/dbPoolStats", methods=["GET"])
+@admin_required
+def getDbPoolStats():
+    """
+    查询数据库连接池状态（当前worker）：正在使用/空闲/溢出的连接数、取连接的等待时间，用于调整连接池大小
+    """
+    try:
+        return jsonify({
+            "code": 200,
+            "message": "success",
+            "data": pool_stats()
+        })
+
+    except Exception as e:
+        return jsonify({
+            "code": 400,
+            "message": f"错误: {str(e)}",
+            "data": None
+        })
+
+
+@admin.route("/reloadCatalog", methods=["POST"])
+@admin_required
+def reloadCatalog():
+    """
+    重新导入题库/游戏库后刷新各worker内存中的索引
+    """
+    try:
+        reload_catalogs()
+        return jsonify({"code": 200, "message": "success", "data": []})
+
+    except Exception as e:
+        return jsonify({
+            "code": 400,
+            "message": f"错误: {str(e)}",
+            "data": None
+        })
@@ -0,0 +1,91 @@
+from bisect import bisect_right
+from datetime import date
+
+import numpy as np
+
+# 量表的主测月龄（测试档位），题库按这些月龄组织
+TEST_MONTHS = (1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12, 15, 18, 21, 24, 27, 30, 33, 36, 42, 48, 54, 60, 66, 72, 78, 84)
+_TEST_MONTHS_ARRAY = np.array(TEST_MONTHS)
+
+
+def _previous_month_days(today):
+    """today 上一个月的天数，日期不够减时借位用"""
+    first = today.replace(day=1)
+    last_month_year = first.year if first.month > 1 else first.year - 1
+    last_month = first.month - 1 if first.month > 1 else 12
+    return (first - date(last_month_year, last_month, 1)).days
+
+
+def exact_month_age(birth_date, today=None):
+    """
+    精确月龄（1位小数）：年×12 + 月 + 日/30，日期不够减时向上个月借位，最小0.1
+    """
+    today = today or date.today()
+    years = today.year - birth_date.year
+    months = today.month - birth_date.month
+    days = today.day - birth_date.day
+    if days < 0:
+        months -= 1
+        days += _previous_month_days(today)
+    if months < 0:
+        years -= 1
+        months += 12
+    total_months = years * 12 + months + days / 30.0
+    return round(max(total_months, 0.1), 1)
+
+
+def whole_month_age(birth_date, today=None):
+    """满月龄（整数），未满一个月按1计，用于计算发育商"""
+    today = today or date.today()
+    month_age = (today.year - birth_date.year) * 12 + (today.month - birth_date.month)
+    if today.day < birth_date.day:
+        month_age -= 1
+    return max(month_age, 1)
+
+
+def test_band(month_age):
+    """不大于 month_age 的最大主测月龄，不足1个月按1，超过84个月按84"""
+    index = bisect_right(TEST_MONTHS, month_age) - 1
+    return TEST_MONTHS[max(index, 0)]
+
+
+def step_band(month_age, direction):
+    """
+    getQuiz 的换档：month_age 正好是某一档时按 direction（1 前进 / -1 后退）移动一档，
+    否则先落到所在的档位
+    """
+    index = max(bisect_right(TEST_MONTHS, month_age) - 1, 0)
+    if TEST_MONTHS[index] == month_age and direction in (1, -1):
+        index = min(max(index + direction, 0), len(TEST_MONTHS) - 1)
+    return TEST_MONTHS[index]
+
+
+def batch_month_ages(birth_dates, today=None):
+    """
+    一次计算整个名单的 精确月龄 / 满月龄 / 主测月龄，结果与逐个调用上面的函数一致
+
+    :param birth_dates: 出生日期序列
+    :return: (exact, whole, band) 三个 numpy 数组
+    """
+    today = today or date.today()
+    count = len(birth_dates)
+    births = np.array([(d.year, d.month, d.day) for d in birth_dates], dtype=np.int64).reshape(count, 3)
+    years = today.year - births[:, 0]
+    months = today.month - births[:, 1]
+    days = today.day - births[:, 2]
+
+    # 满月龄
+    whole = np.maximum(years * 12 + months - (days < 0), 1)
+
+    # 精确月龄：上个月的天数只与 today 有关，可以整体借位
+    borrow = days < 0
+    months = months - borrow
+    days = np.where(borrow, days + _previous_month_days(today), days)
+    borrow = months < 0
+    years = years - borrow
+    months = np.where(borrow, months + 12, months)
+    exact = np.round(np.maximum(years * 12 + months + days / 30.0, 0.1), 1)
+
+    index = np.searchsorted(_TEST_MONTHS_ARRAY, exact, side='right') - 1
+    band = _TEST_MONTHS_ARRAY[np.maximum(index, 0)]
+    return exact, whole, band
@@ -1,27 +1,359 @@
-from flask import jsonify
-from .models import Admin, Parent, Teacher
+import time
+from threading import Lock
+from types import SimpleNamespace
+
+import jwt
+from functools import wraps
+from flask import jsonify, current_app, request, g
+from .cache import cache, MemoryBackend
+from .models import db, Admin, Parent, Teacher, TeacherClass
+
+# token 中 role 声明对应的用户表
+ROLE_MODELS = {
+    'admin': Admin,
+    'teacher': Teacher,
+    'parent': Parent,
+}
+
+# 同一手机号存在于多张表时，登录按此顺序尝试
+LOGIN_ORDER = ('parent', 'teacher', 'admin')
+
+# 体验班，每个老师都能测试
+EXPERIENCE_CLASS_ID = 1
+
+# 用户token版本号的有效期，过期后重新生成（只会让各worker多查一次库）
+TOKEN_EPOCH_TTL = 30 * 24 * 3600
+
+
+class TokenCache:
+    """
+    (user_id, token) -> (role, 用户快照) 的进程内缓存，每个worker一份LRU
+    登录换token、删除用户、修改角色时 invalidate_user 更新该用户在应用缓存中的版本号，
+    命中前读一次版本号与条目记录的比较，其他worker上的旧条目随之失效；
+    缓存后端不共享（memory）时版本号通知不到其他worker，不缓存，每次查库验证
+    """
+
+    def __init__(self, ttl=60, max_size=4096):
+        self.ttl = ttl
+        self._local = MemoryBackend(max_size)
+
+    @staticmethod
+    def _epoch_key(user_id):
+        return f"token_epoch:{user_id}"
+
+    def epoch(self, user_id):
+        """该用户当前的版本号，不存在（过期、被淘汰）时生成一个新值，进程内已有的条目随之失效"""
+        epoch = cache.get(self._epoch_key(user_id))
+        if epoch is None:
+            epoch = time.time_ns()
+            cache.set(self._epoch_key(user_id), epoch, ttl=TOKEN_EPOCH_TTL)
+        return epoch
+
+    def get(self, user_id, token):
+        """
+        :return: (缓存的 (role, 快照)，未命中为 None；当前版本号)
+                 版本号在查库之前读取，查库后原样传给 set，期间发生的失效不会被覆盖
+        """
+        if not cache.shared:
+            return None, None
+        epoch = self.epoch(user_id)
+        item = self._local.get((str(user_id), token))
+        if item is not None and item[0] == epoch:
+            return item[1], epoch
+        return None, epoch
+
+    def set(self, user_id, token, value, epoch):
+        if not cache.shared or epoch is None:
+            return
+        self._local.set((str(user_id), token), (epoch, value), self.ttl)
+
+    def invalidate_user(self, user_id):
+        """使该 user_id 在所有worker中缓存的token失效，返回新的版本号"""
+        epoch = time.time_ns()
+        cache.set(self._epoch_key(user_id), epoch, ttl=TOKEN_EPOCH_TTL)
+        return epoch
+
+
+token_cache = TokenCache()
+
+
+class IdentityIndex:
+    """
+    进程内的 手机号 -> ((role, user_id), ...) 索引
+    首次登录时从三张用户表预热，之后登录只需一次主键查询即可定位账号
+    """
+
+    def __init__(self):
+        self._data = None
+        self._lock = Lock()
+
+    def warm(self):
+        data = {}
+        for role in LOGIN_ORDER:
+            model = ROLE_MODELS[role]
+            pk = model.__mapper__.primary_key[0]
+            for phone, user_id in model.query.with_entities(model.phone, pk).all():
+                data[phone] = data.get(phone, ()) + ((role, user_id),)
+        with self._lock:
+            self._data = data
+
+    def lookup(self, phone):
+        if self._data is None:
+            self.warm()
+        return self._data.get(phone, ())
+
+    def add(self, phone, role, user_id):
+        with self._lock:
+            if self._data is None:
+                return
+            entries = [e for e in self._data.get(phone, ()) if e != (role, user_id)]
+            entries.append((role, user_id))
+            entries.sort(key=lambda e: LOGIN_ORDER.index(e[0]))
+            self._data[phone] = tuple(entries)
+
+    def remove(self, phone, role, user_id):
+        with self._lock:
+            if self._data is None or phone not in self._data:
+                return
+            entries = tuple(e for e in self._data[phone] if e != (role, user_id))
+            if entries:
+                self._data[phone] = entries
+            else:
+                del self._data[phone]
+
+    def clear(self):
+        with self._lock:
+            self._data = None
+
+
+identity_index = IdentityIndex()
+
+def init_token_cache(app):
+    token_cache.ttl = app.config.get('TOKEN_CACHE_TTL', 60)
+    token_cache._local = MemoryBackend(app.config.get('CACHE_MAX_SIZE', 4096))
+
+
+def teacher_class_ids(teacher_id):
+    """
+    教师可操作的班级id集合（含体验班），用于 O(1) 判断班级权限
+    用于鉴权，分班变化后所有worker都要立即生效，缓存后端不共享（memory）时不缓存，每次查库
+    """
+    key = f"teacher_classes:{int(teacher_id)}"
+    class_ids = cache.get(key) if cache.shared else None
+    if class_ids is None:
+        rows = db.session.query(TeacherClass.class_id).filter(TeacherClass.teacher_id == teacher_id).all()
+        class_ids = frozenset([row.class_id for row in rows] + [EXPERIENCE_CLASS_ID])
+        if cache.shared:
+            cache.set(key, class_ids, ttl=current_app.config.get('TEACHER_CLASS_CACHE_TTL', 300),
+                      tags=("teacher_classes",))
+    return class_ids
+
+
+def invalidate_teacher_classes(*teacher_ids):
+    """
+    教师-班级关联变化后调用；不传参数时清空所有教师的缓存（例如删除班级）
+    """
+    if not teacher_ids:
+        cache.delete_tag("teacher_classes")
+    for teacher_id in teacher_ids:
+        cache.delete(f"teacher_classes:{int(teacher_id)}")
+
+
+def permissions_of(user, role):
+    """
+    用户拥有的身份集合：admin / teacher / parent，教师再加上其职务（园长、管理级教师）
+    """
+    permissions = {role}
+    if role == 'teacher' and user.role:
+        permissions.add(user.role)
+    return frozenset(permissions)
+
+
+def _snapshot(user, role):
+    """把ORM对象复制成与session无关的只读快照（不包含密码哈希），并预先算好身份集合"""
+    snapshot = SimpleNamespace(**{
+        column.key: getattr(user, column.key)
+        for column in user.__table__.columns
+        if column.key != 'pwd'
+    })
+    snapshot.permissions = permissions_of(user, role)
+    return snapshot
+
+
+def decode_token(token):
+    """
+    本地校验 token 的 HS256 签名与过期时间，不访问数据库
+
+    :return: payload 字典，校验失败返回 None
+    """
+    if not token:
+        return None
+    try:
+        return jwt.decode(token, current_app.config['SECRET_KEY'], algorithms=['HS256'])
+    except jwt.InvalidTokenError:  # 包含 ExpiredSignatureError
+        return None
+
+
+def primary_key_of(user):
+    return getattr(user, user.__mapper__.primary_key[0].key)
+
+
+def probe_accounts_by_phone(phone):
+    """旧的登录查找方式：依次按手机号查 Parent、Teacher、Admin 三张表"""
+    accounts = []
+    for role in LOGIN_ORDER:
+        model = ROLE_MODELS[role]
+        user = model.query.filter(model.phone == phone).first()
+        if user:
+            accounts.append((role, user))
+    return accounts
+
+
+def find_accounts_by_phone(phone):
+    """
+    通过身份索引查找手机号对应的账号
+
+    :return: [(role, user), ...]，按 家长/教师/管理员 顺序
+    """
+    accounts = []
+    for role, user_id in identity_index.lookup(phone):
+        user = ROLE_MODELS[role].query.get(user_id)
+        if user and user.phone == phone:
+            accounts.append((role, user))
+    if not accounts:
+        # 索引未命中（例如其他worker刚注册的账号），回退查表并补进索引
+        accounts = probe_accounts_by_phone(phone)
+        for role, user in accounts:
+            identity_index.add(phone, role, primary_key_of(user))
+    return accounts
+
+
+def login_candidates(phone):
+    """
+    登录时依次验证密码的账号：先是身份索引中的账号，
+    调用方继续迭代（索引中的账号密码都不匹配）时再查表，补上索引中没有的账号，
+    例如其他worker刚为同一手机号注册的另一种身份
+    """
+    accounts = find_accounts_by_phone(phone)
+    yield from accounts
+    if not accounts:
+        # find_accounts_by_phone 已经查过表
+        return
+    known = {(role, primary_key_of(user)) for role, user in accounts}
+    for role, user in probe_accounts_by_phone(phone):
+        if (role, primary_key_of(user)) not in known:
+            identity_index.add(phone, role, primary_key_of(user))
+            yield role, user
+
+
+def remember_token(user, role, token):
+    """登录换发token后直接写入缓存，之后的请求无需再查库"""
+    user_id = primary_key_of(user)
+    epoch = token_cache.invalidate_user(user_id)
+    token_cache.set(user_id, token, (role, _snapshot(user, role)), epoch)
+
+
+def _verify_by_probe(user_id, token):
+    # 依次在 Admin、Teacher、Parent 表中查找
+    for role, model in ROLE_MODELS.items():
+        user = model.query.get(user_id)
+        if user and hasattr(user, 'token') and user.token == token:
+            return user, role
+    return None, None
+
+
+def _verify_by_claims(user_id, token, payload):
+    # payload 为已校验过签名和过期时间的声明，只查 role 声明指定的那一张表
+    if not payload or str(payload.get('user_id')) != str(user_id):
+        return None, None
+    role = payload.get('role')
+    model = ROLE_MODELS.get(role)
+    if model is None:
+        return None, None
+    user = model.query.get(user_id)
+    if user and user.token == token:
+        return user, role
+    return None, None
+
 
 def verify_token_and_get_user(user_id, token):
     """
     通过 user_id 和 token 验证用户，并返回用户对象和角色
 
+    TOKEN_VERIFY_MODE 为 "signature"（默认）时先本地校验JWT签名，
+    过期或伪造的token不访问数据库；为 "probe" 时按旧逻辑依次查三张表
+
     :param user_id: 用户ID
     :param token: 前端发来的 uniquetoken
     :return: (user, role) 元组，如果验证失败则返回 (None, None)
     """
-    # 尝试在 Admin 表中查找
-    user = Admin.query.get(user_id)
-    if user and hasattr(user, 'token') and user.token == token:
-        return user, 'admin'
+    signature_mode = current_app.config.get('TOKEN_VERIFY_MODE', 'signature') == 'signature'
+    # 签名只校验一次，缓存未命中时直接使用解出的声明
+    payload = decode_token(token) if signature_mode else None
+    if signature_mode and payload is None:
+        return None, None
+
+    cached, epoch = token_cache.get(user_id, token)
+    if cached is not None:
+        role, user = cached
+        return user, role
+
+    if signature_mode:
+        user, role = _verify_by_claims(user_id, token, payload)
+    else:
+        user, role = _verify_by_probe(user_id, token)
+    if not user:
+        return None, None
+
+    snapshot = _snapshot(user, role)
+    token_cache.set(user_id, token, (role, snapshot), epoch)
+    return snapshot, role
+
+
+TOKEN_MISMATCH = {"code": 403, "message": "Token mismatch, potential new device login.", "data": None}
+NO_PERMISSION = {"code": 400, "message": "没有操作权限", "data": []}
+ADMIN_DENIED = {"code": 403, "message": "Token无效或权限不足", "data": None}
+
+
+def _request_value(name):
+    # 先取URL参数，再取JSON body
+    value = request.args.get(name)
+    if value is None:
+        data = request.get_json(silent=True)
+        if isinstance(data, dict):
+            value = data.get(name)
+    return value
+
+
+def require_role(*allowed, id_field='manager_id', unauthorized=TOKEN_MISMATCH, forbidden=NO_PERMISSION):
+    """
+    接口鉴权装饰器：验证一次token，并把 用户快照/角色/身份集合 存到 flask.g
+
+    :param allowed: 允许访问的身份，如 'admin'、'园长'、'管理级教师'；为空时只要求登录
+    :param id_field: 请求中用户ID的参数名，与 uniquetoken 一样先从URL参数、再从JSON body读取
+    :param unauthorized: token 验证失败时返回的内容
+    :param forbidden: 没有权限时返回的内容
+    """
+    allowed = frozenset(allowed)
 
-    # 尝试在 Teacher 表中查找
-    user = Teacher.query.get(user_id)
-    if user and hasattr(user, 'token') and user.token == token:
-        return user, 'teacher'
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            user_id = _request_value(id_field)
+            uniquetoken = _request_value('uniquetoken')
+            if not user_id or not uniquetoken:
+                return jsonify({"code": 400, "message": "缺少必要参数", "data": None})
 
-    # 尝试在 Parent 表中查找
-    user = Parent.query.get(user_id)
-    if user and hasattr(user, 'token') and user.token == token:
-        return user, 'parent'
+            user, role = verify_token_and_get_user(user_id, uniquetoken)
+            if not user:
+                return jsonify(unauthorized)
+            if allowed and allowed.isdisjoint(user.permissions):
+                return jsonify(forbidden)
 
-    return None, None
\ No newline at end of file
+            g.user = user
+            g.user_id = getattr(user, ROLE_MODELS[role].__mapper__.primary_key[0].key)
+            g.role = role
+            g.permissions = user.permissions
+            return view(*args, **kwargs)
+        return wrapper
+    return decorator
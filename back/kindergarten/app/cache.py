@@ -0,0 +1,298 @@
+import fnmatch
+import os
+import pickle
+import sqlite3
+import time
+from collections import OrderedDict
+from threading import Lock, local
+
+
+class MemoryBackend:
+    """
+    进程内缓存，条目带 TTL，超过容量时按 LRU 淘汰
+    每个 gunicorn worker 各自一份
+    """
+
+    shared = False
+
+    def __init__(self, max_size=4096):
+        self.max_size = max_size
+        self._data = OrderedDict()  # key -> (过期时间, value, tags)
+        self._tags = {}  # tag -> set(key)
+        self._lock = Lock()
+
+    def _remove(self, key):
+        _, _, tags = self._data.pop(key)
+        for tag in tags:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            if item[0] < time.monotonic():
+                self._remove(key)
+                return None
+            self._data.move_to_end(key)
+            return item[1]
+
+    def set(self, key, value, ttl, tags=()):
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+            self._data[key] = (time.monotonic() + ttl, value, tuple(tags))
+            for tag in tags:
+                self._tags.setdefault(tag, set()).add(key)
+            while len(self._data) > self.max_size:
+                self._remove(next(iter(self._data)))
+
+    def delete(self, key):
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+
+    def delete_tag(self, tag):
+        with self._lock:
+            for key in list(self._tags.get(tag, ())):
+                self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._tags.clear()
+
+
+class SQLiteBackend:
+    """
+    基于本机SQLite文件的缓存，同一台机器上的多个 gunicorn worker 共享
+    每个线程复用一个连接（WAL 模式下读不阻塞写），每次缓存读写不再新建连接
+    """
+
+    shared = True
+
+    def __init__(self, path):
+        self.path = path
+        self._sets = 0
+        self._local = local()
+        self._execute(
+            ("PRAGMA journal_mode=WAL", ()),
+            ("CREATE TABLE IF NOT EXISTS cache_entry "
+             "(key TEXT PRIMARY KEY, value BLOB NOT NULL, expires_at REAL NOT NULL)", ()),
+            ("CREATE TABLE IF NOT EXISTS cache_tag (tag TEXT NOT NULL, key TEXT NOT NULL, PRIMARY KEY (tag, key))", ()),
+            ("CREATE INDEX IF NOT EXISTS ix_cache_tag_key ON cache_tag (key)", ()),
+        )
+
+    def _connection(self):
+        # gunicorn --preload 时 master 中建立的连接不能在 fork 出的 worker 中使用，按进程号区分
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5)
+            # 缓存丢失最后几次写入没有影响，WAL 下只在检查点时同步磁盘
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _execute(self, *statements):
+        conn = self._connection()
+        with conn:
+            for sql, params in statements:
+                row = conn.execute(sql, params).fetchone()
+        return row
+
+    def get(self, key):
+        row = self._execute(("SELECT value, expires_at FROM cache_entry WHERE key = ?", (key,)))
+        if row is None or row[1] < time.time():
+            return None
+        return pickle.loads(row[0])
+
+    def set(self, key, value, ttl, tags=()):
+        statements = [
+            ("DELETE FROM cache_tag WHERE key = ?", (key,)),
+            ("INSERT OR REPLACE INTO cache_entry (key, value, expires_at) VALUES (?, ?, ?)",
+             (key, pickle.dumps(value), time.time() + ttl)),
+        ]
+        statements += [("INSERT OR IGNORE INTO cache_tag (tag, key) VALUES (?, ?)", (tag, key)) for tag in tags]
+        self._sets += 1
+        if self._sets % 500 == 0:
+            # 定期清理过期条目
+            statements += [
+                ("DELETE FROM cache_tag WHERE key IN (SELECT key FROM cache_entry WHERE expires_at < ?)", (time.time(),)),
+                ("DELETE FROM cache_entry WHERE expires_at < ?", (time.time(),)),
+            ]
+        self._execute(*statements)
+
+    def delete(self, key):
+        self._execute(
+            ("DELETE FROM cache_entry WHERE key = ?", (key,)),
+            ("DELETE FROM cache_tag WHERE key = ?", (key,)),
+        )
+
+    def delete_tag(self, tag):
+        keys = "SELECT key FROM cache_tag WHERE tag = ?"
+        self._execute(
+            (f"DELETE FROM cache_entry WHERE key IN ({keys})", (tag,)),
+            (f"DELETE FROM cache_tag WHERE key IN ({keys})", (tag,)),
+        )
+
+    def clear(self):
+        self._execute(("DELETE FROM cache_entry", ()), ("DELETE FROM cache_tag", ()))
+
+
+class RedisBackend:
+    """
+    redis 缓存，多台机器共享；client 只需要提供 get/set/delete/sadd/smembers/ttl/expire/scan_iter
+    """
+
+    def __init__(self, client, prefix="kindergarten:"):
+        self.client = client
+        self.prefix = prefix
+        # 本地替身只在当前进程内有效
+        self.shared = not isinstance(client, LocalRedis)
+
+    def get(self, key):
+        value = self.client.get(self.prefix + key)
+        return None if value is None else pickle.loads(value)
+
+    def set(self, key, value, ttl, tags=()):
+        self.client.set(self.prefix + key, pickle.dumps(value), ex=max(int(ttl), 1))
+        for tag in tags:
+            tag_key = f"{self.prefix}tag:{tag}"
+            self.client.sadd(tag_key, key)
+            # 标签集合的有效期不短于其中最晚过期的条目，条目全部过期后集合也随之删除，不会无限增长
+            if self.client.ttl(tag_key) < ttl:
+                self.client.expire(tag_key, max(int(ttl), 1))
+
+    def delete(self, key):
+        self.client.delete(self.prefix + key)
+
+    def delete_tag(self, tag):
+        tag_key = f"{self.prefix}tag:{tag}"
+        keys = [self.prefix + (k.decode() if isinstance(k, bytes) else k) for k in self.client.smembers(tag_key)]
+        self.client.delete(tag_key, *keys)
+
+    def clear(self):
+        keys = list(self.client.scan_iter(match=self.prefix + "*"))
+        if keys:
+            self.client.delete(*keys)
+
+
+class LocalRedis:
+    """
+    本地替身：实现 RedisBackend 用到的 redis 命令，开发和测试时不需要启动 redis
+    """
+
+    def __init__(self):
+        self._data = {}
+        self._lock = Lock()
+
+    def _alive(self, name):
+        item = self._data.get(name)
+        if item is not None and item[1] is not None and item[1] < time.time():
+            del self._data[name]
+            return None
+        return item
+
+    def get(self, name):
+        with self._lock:
+            item = self._alive(name)
+            return None if item is None else item[0]
+
+    def set(self, name, value, ex=None):
+        with self._lock:
+            self._data[name] = (value, None if ex is None else time.time() + ex)
+        return True
+
+    def delete(self, *names):
+        with self._lock:
+            return sum(self._data.pop(name, None) is not None for name in names)
+
+    def sadd(self, name, *values):
+        with self._lock:
+            item = self._alive(name)
+            members, expires_at = item if item else (set(), None)
+            members.update(values)
+            self._data[name] = (members, expires_at)
+
+    def ttl(self, name):
+        """与 redis 一致：不存在返回 -2，没有过期时间返回 -1"""
+        with self._lock:
+            item = self._alive(name)
+            if item is None:
+                return -2
+            return -1 if item[1] is None else int(item[1] - time.time())
+
+    def expire(self, name, seconds):
+        with self._lock:
+            item = self._alive(name)
+            if item is None:
+                return False
+            self._data[name] = (item[0], time.time() + seconds)
+            return True
+
+    def smembers(self, name):
+        with self._lock:
+            item = self._alive(name)
+            return set(item[0]) if item else set()
+
+    def scan_iter(self, match="*"):
+        with self._lock:
+            return [name for name in self._data if fnmatch.fnmatchcase(name, match)]
+
+
+class Cache:
+    """
+    应用使用的缓存入口，具体存储由 CACHE_BACKEND 决定：
+    memory（进程内LRU）/ sqlite（本机多worker共享）/ redis
+    """
+
+    def __init__(self, backend=None):
+        self.backend = backend or MemoryBackend()
+
+    @property
+    def shared(self):
+        """所有worker是否共用同一份数据；不共用时，依赖写接口主动失效的缓存不能使用"""
+        return self.backend.shared
+
+    def get(self, key):
+        return self.backend.get(key)
+
+    def set(self, key, value, ttl=60, tags=()):
+        """tags：该条目所属的标签，之后可以用 delete_tag 整组失效"""
+        self.backend.set(key, value, ttl, tags)
+
+    def delete(self, key):
+        self.backend.delete(key)
+
+    def delete_tag(self, tag):
+        self.backend.delete_tag(tag)
+
+    def clear(self):
+        self.backend.clear()
+
+
+cache = Cache()
+
+
+def init_cache(app):
+    backend = app.config.get("CACHE_BACKEND", "sqlite")
+    if backend == "sqlite":
+        cache.backend = SQLiteBackend(app.config.get("CACHE_SQLITE_PATH")
+                                      or os.path.join(os.path.dirname(app.root_path), "db/cache.db"))
+    elif backend == "redis":
+        url = app.config.get("CACHE_REDIS_URL", "local")
+        if url == "local":
+            client = LocalRedis()
+        else:
+            import redis  # 可选依赖，只有使用redis缓存时才需要安装
+            client = redis.Redis.from_url(url)
+        cache.backend = RedisBackend(client)
+    else:
+        cache.backend = MemoryBackend(app.config.get("CACHE_MAX_SIZE", 4096))
@@ -0,0 +1,201 @@
+import time
+from bisect import bisect_right
+from threading import Lock
+
+from flask import current_app
+
+from .cache import cache
+from .models import QuizInfo, Game
+
+# 题库等参考数据重新导入后更新此版本号，各worker下次访问时自动重新加载
+CATALOG_VERSION_KEY = "catalog_version"
+CATALOG_VERSION_TTL = 30 * 24 * 3600
+# 每个worker最多每隔多少秒读一次版本号，其余访问不读缓存；重新导入后其他worker最迟这么久之后重新加载
+CATALOG_CHECK_SECONDS = 5
+
+
+class QuizRecord:
+    __slots__ = ("quiz_id", "quiz_name", "quiz_method", "pass_need", "sort", "month_age")
+
+    def __init__(self, quiz_id, quiz_name, quiz_method, pass_need, sort, month_age):
+        self.quiz_id = quiz_id
+        self.quiz_name = quiz_name
+        self.quiz_method = quiz_method
+        self.pass_need = pass_need
+        self.sort = sort
+        self.month_age = month_age
+
+
+class GameRecord:
+    __slots__ = ("game_id", "game_name", "game_sort", "game_beginTime", "game_endTime", "game_bg",
+                 "game_prepare", "game_purpose", "game_process", "cautions")
+
+    # recommendGame 默认返回的字段（不含 game_id）
+    FIELDS = ("game_name", "game_sort", "game_beginTime", "game_endTime", "game_bg",
+              "game_prepare", "game_purpose", "game_process", "cautions")
+    # view=summary：列表页只需要名称和适用月龄，详情通过 /teacher/game/<id> 获取
+    SUMMARY_FIELDS = ("game_id", "game_name", "game_sort", "game_beginTime", "game_endTime")
+
+    def __init__(self, game):
+        for name in self.__slots__:
+            setattr(self, name, getattr(game, name))
+
+    def to_dict(self, fields=FIELDS):
+        return {name: getattr(self, name) for name in fields}
+
+
+class Catalog:
+    """
+    每个worker加载一次的静态参考数据，子类实现 _load()
+    """
+
+    def __init__(self):
+        self._loaded = False
+        self._version = None
+        self._checked_at = 0.0
+        self._lock = Lock()
+
+    def _load(self):
+        raise NotImplementedError
+
+    def ensure_loaded(self):
+        now = time.monotonic()
+        if self._loaded and now - self._checked_at < CATALOG_CHECK_SECONDS:
+            return
+        version = cache.get(CATALOG_VERSION_KEY)
+        self._checked_at = now
+        if self._loaded and version == self._version:
+            return
+        with self._lock:
+            if self._loaded and version == self._version:
+                return
+            self._load()
+            self._version = version
+            self._loaded = True
+
+    def reload(self):
+        with self._lock:
+            self._loaded = False
+        self.ensure_loaded()
+
+
+class QuizCatalog(Catalog):
+    """
+    QuizInfo 题库索引：(month_age, sort) -> 按 quiz_id 排序的题目元组
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._by_key = {}
+        self._by_id = {}
+
+    def _load(self):
+        by_key = {}
+        by_id = {}
+        for quiz in QuizInfo.query.order_by(QuizInfo.quiz_id).all():
+            record = QuizRecord(quiz.quiz_id, quiz.quiz_name, quiz.quiz_method, quiz.pass_need,
+                                quiz.sort, quiz.month_age)
+            by_key.setdefault((record.month_age, record.sort), []).append(record)
+            by_id[record.quiz_id] = record
+        self._by_key = {key: tuple(records) for key, records in by_key.items()}
+        self._by_id = by_id
+
+    def get(self, month_age, sort):
+        self.ensure_loaded()
+        return self._by_key.get((month_age, sort), ())
+
+    def get_by_id(self, quiz_id):
+        self.ensure_loaded()
+        return self._by_id.get(quiz_id)
+
+
+quiz_catalog = QuizCatalog()
+
+
+class GameCatalog(Catalog):
+    """
+    游戏库区间索引：每个 game_sort 一组按 game_beginTime 排序的游戏，
+    查询月龄 m 时二分找到 beginTime <= m 的前缀，再过滤 endTime >= m
+    每个 (sort, month_age) 的 recommendGame 响应体序列化一次后缓存为 bytes
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._begins = {}
+        self._games = {}
+        self._by_id = {}
+        self._bodies = {}
+        self._month_ages = (0, 0)
+
+    def _load(self):
+        begins = {}
+        games = {}
+        by_id = {}
+        for game in Game.query.order_by(Game.game_beginTime, Game.game_id).all():
+            record = GameRecord(game)
+            begins.setdefault(record.game_sort, []).append(record.game_beginTime)
+            games.setdefault(record.game_sort, []).append(record)
+            by_id[record.game_id] = record
+        self._begins = begins
+        self._games = games
+        self._by_id = by_id
+        self._bodies = {}
+        # 所有游戏适用月龄的范围，范围外的月龄都没有游戏
+        records = list(by_id.values())
+        self._month_ages = (min((g.game_beginTime for g in records), default=0),
+                            max((g.game_endTime for g in records), default=0))
+
+    def get_by_id(self, game_id):
+        self.ensure_loaded()
+        return self._by_id.get(game_id)
+
+    def find(self, game_sort, month_age):
+        """game_sort 类中适合 month_age 月龄的游戏，按 game_id 排序"""
+        self.ensure_loaded()
+        games = self._games.get(game_sort, [])
+        end = bisect_right(self._begins.get(game_sort, []), month_age)
+        return sorted((g for g in games[:end] if g.game_endTime >= month_age), key=lambda g: g.game_id)
+
+    def response_body(self, game_sort, month_age, fields=GameRecord.FIELDS):
+        """
+        recommendGame 的完整 JSON 响应体（bytes）
+
+        :param fields: 每个游戏返回的字段，需为 GameRecord.__slots__ 中的字段
+                       只有默认字段和 SUMMARY_FIELDS 的响应体会被缓存
+        """
+        self.ensure_loaded()
+        if fields not in (GameRecord.FIELDS, GameRecord.SUMMARY_FIELDS):
+            games = self.find(game_sort, month_age)
+            payload = {'code': 200, 'message': 'success', 'data': [g.to_dict(fields) for g in games]}
+            return current_app.json.response(payload).get_data()
+
+        # 月龄由客户端传入，限制在游戏月龄范围外一个月以内，避免任意月龄使缓存的响应体无限增长
+        lowest, highest = self._month_ages
+        month_age = min(max(month_age, lowest - 1), highest + 1)
+        key = (game_sort, month_age, fields)
+        body = self._bodies.get(key)
+        if body is None:
+            games = self.find(game_sort, month_age)
+            # 游戏集合相同的月龄共用同一份响应体
+            ids = (tuple(g.game_id for g in games), fields)
+            body = self._bodies.get(ids)
+            if body is None:
+                payload = {'code': 200, 'message': 'success', 'data': [g.to_dict(fields) for g in games]}
+                # 与 jsonify 的输出完全一致
+                body = current_app.json.response(payload).get_data()
+                self._bodies[ids] = body
+            self._bodies[key] = body
+        return body
+
+
+game_catalog = GameCatalog()
+
+
+def reload_catalogs():
+    """
+    题库/游戏库重新导入后调用：更新版本号，当前worker立即重新加载，其他worker在 CATALOG_CHECK_SECONDS 秒内重新加载
+    （版本号存放在应用缓存中，CACHE_BACKEND 为 memory 时只有当前worker会重新加载）
+    """
+    cache.set(CATALOG_VERSION_KEY, time.time(), ttl=CATALOG_VERSION_TTL)
+    quiz_catalog.reload()
+    game_catalog.reload()
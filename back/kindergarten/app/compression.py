@@ -0,0 +1,92 @@
+import gzip
+import hashlib
+
+from flask import request
+
+from .cache import MemoryBackend
+
+try:  # 可选依赖，未安装时只使用 gzip
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE_MIMETYPES = ("application/json", "text/html", "text/plain", "text/css", "application/javascript")
+
+
+class Compressor:
+    """
+    按 Accept-Encoding 协商 br / gzip 压缩响应体
+    GET 请求的压缩结果按 (编码, 响应体摘要) 缓存在进程内，
+    recommendGame 预序列化的响应体、带 ETag 的列表等重复内容只压缩一次
+    """
+
+    def __init__(self, min_size=1024, level=6, cache_size=256):
+        self.min_size = min_size
+        self.level = level
+        self._cache = MemoryBackend(cache_size)
+
+    def configure(self, min_size, level, cache_size):
+        self.min_size = min_size
+        self.level = level
+        self._cache = MemoryBackend(cache_size)
+
+    def choose_encoding(self):
+        accept = request.accept_encodings
+        if brotli is not None and accept["br"]:
+            return "br"
+        if accept["gzip"]:
+            return "gzip"
+        return None
+
+    def compress(self, data, encoding):
+        if encoding == "br":
+            # brotli 的 quality 取值 0-11，与 gzip 的 level 大致对应
+            return brotli.compress(data, quality=min(self.level, 11))
+        return gzip.compress(data, compresslevel=self.level, mtime=0)
+
+    def compress_cached(self, data, encoding):
+        key = f"{encoding}:{hashlib.blake2b(data, digest_size=16).hexdigest()}"
+        compressed = self._cache.get(key)
+        if compressed is None:
+            compressed = self.compress(data, encoding)
+            self._cache.set(key, compressed, ttl=24 * 3600)
+        return compressed
+
+    def after_request(self, response):
+        if (response.status_code != 200 or response.direct_passthrough
+                or "Content-Encoding" in response.headers
+                or response.mimetype not in COMPRESSIBLE_MIMETYPES):
+            return response
+        response.vary.add("Accept-Encoding")
+        encoding = self.choose_encoding()
+        if encoding is None:
+            return response
+        data = response.get_data()
+        if len(data) < self.min_size:
+            return response
+
+        if request.method == "GET":
+            compressed = self.compress_cached(data, encoding)
+        else:
+            compressed = self.compress(data, encoding)
+        response.set_data(compressed)
+        response.headers["Content-Encoding"] = encoding
+        # 压缩后的内容与原始内容字节不同，强 ETag 改为弱 ETag
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(etag, weak=True)
+        return response
+
+
+compressor = Compressor()
+
+
+def init_compression(app):
+    if not app.config.get("COMPRESS_ENABLED", True):
+        return
+    compressor.configure(
+        app.config.get("COMPRESS_MIN_SIZE", 1024),
+        app.config.get("COMPRESS_LEVEL", 6),
+        app.config.get("COMPRESS_CACHE_SIZE", 256),
+    )
+    app.after_request(compressor.after_request)
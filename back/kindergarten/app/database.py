@@ -0,0 +1,164 @@
+import os
+import time
+from threading import Lock
+
+from sqlalchemy import event, exc
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import QueuePool
+
+from .models import db
+
+
+class PoolMetrics:
+    """连接池的累计计数（当前worker），用于调整 pool_size / max_overflow"""
+
+    def __init__(self):
+        self._lock = Lock()
+        self.checkouts = 0
+        self.connects = 0
+        self.invalidated = 0
+        self.timeouts = 0
+        self.waits = 0
+        self.peak_checked_out = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def record_wait(self, seconds, timeout=False):
+        with self._lock:
+            self.waits += 1
+            self.wait_total += seconds
+            self.wait_max = max(self.wait_max, seconds)
+            if timeout:
+                self.timeouts += 1
+
+    def record_checkout(self, checked_out):
+        with self._lock:
+            self.checkouts += 1
+            self.peak_checked_out = max(self.peak_checked_out, checked_out)
+
+
+class MeteredQueuePool(QueuePool):
+    """记录取连接等待时间的 QueuePool（等待时间包括连接池已满时的排队和新建连接）"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.metrics = PoolMetrics()
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except exc.TimeoutError:
+            self.metrics.record_wait(time.perf_counter() - start, timeout=True)
+            raise
+        self.metrics.record_wait(time.perf_counter() - start)
+        return connection
+
+
+def sqlite_pragmas(pragmas):
+    """
+    返回 engine 的 connect 事件处理函数：每个新建的SQLite连接依次执行 PRAGMA
+    journal_mode=WAL 写入数据库文件后一直有效，其余 PRAGMA 只对当前连接有效，所以每个连接都要执行
+    """
+    def on_connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in pragmas.items():
+                cursor.execute(f"PRAGMA {name}={value}")
+        finally:
+            cursor.close()
+    return on_connect
+
+
+def mysql_statement_timeout(milliseconds):
+    """返回 connect 事件处理函数：限制当前会话中 SELECT 语句的执行时间（MySQL 5.7.8+）"""
+    def on_connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            cursor.execute(f"SET SESSION max_execution_time = {int(milliseconds)}")
+        finally:
+            cursor.close()
+    return on_connect
+
+
+def watch_pool(engine):
+    """统计签出次数、签出连接数峰值、新建连接数和失效连接数（pre-ping 发现的断开连接等）"""
+    def on_checkout(dbapi_connection, connection_record, connection_proxy):
+        engine.pool.metrics.record_checkout(engine.pool.checkedout())
+
+    def on_connect(dbapi_connection, connection_record):
+        engine.pool.metrics.connects += 1
+
+    def on_invalidate(dbapi_connection, connection_record, exception):
+        engine.pool.metrics.invalidated += 1
+
+    event.listen(engine, "checkout", on_checkout)
+    event.listen(engine, "connect", on_connect)
+    event.listen(engine, "invalidate", on_invalidate)
+
+
+def _is_memory_sqlite(uri):
+    url = make_url(uri)
+    return url.get_backend_name() == "sqlite" and url.database in (None, "", ":memory:")
+
+
+def init_pool_options(app):
+    """
+    在 db.init_app 之前调用：连接池（SQLALCHEMY_ENGINE_OPTIONS）使用 MeteredQueuePool，
+    SQLALCHEMY_BINDS 中只写了地址的库（只读副本）使用与主库相同的连接池参数
+    """
+    options = dict(app.config.get("SQLALCHEMY_ENGINE_OPTIONS") or {})
+    # 内存SQLite数据库由 Flask-SQLAlchemy 使用 StaticPool
+    if not _is_memory_sqlite(app.config["SQLALCHEMY_DATABASE_URI"]):
+        options.setdefault("poolclass", MeteredQueuePool)
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = options
+
+    binds = {}
+    for key, value in (app.config.get("SQLALCHEMY_BINDS") or {}).items():
+        if isinstance(value, str) and not _is_memory_sqlite(value):
+            value = dict(options, url=value, poolclass=MeteredQueuePool)
+        binds[key] = value
+    app.config["SQLALCHEMY_BINDS"] = binds
+
+
+def init_database(app):
+    """按配置为新建的连接设置 SQLite PRAGMA / MySQL 语句超时，需在第一次连接数据库（迁移）之前调用"""
+    pragmas = app.config.get("SQLITE_PRAGMAS")
+    statement_timeout = app.config.get("DB_STATEMENT_TIMEOUT", 0)
+    with app.app_context():
+        engines = list(db.engines.values())
+    for engine in engines:
+        if isinstance(engine.pool, MeteredQueuePool):
+            watch_pool(engine)
+        if pragmas and engine.dialect.name == "sqlite":
+            event.listen(engine, "connect", sqlite_pragmas(pragmas))
+        if statement_timeout and engine.dialect.name == "mysql":
+            event.listen(engine, "connect", mysql_statement_timeout(statement_timeout))
+
+
+def pool_stats():
+    """
+    当前worker各数据库连接池的状态：
+    checked_out 正在使用的连接数，overflow 超出 pool_size 临时创建的连接数（可为负，表示池中还未建满），
+    wait_avg_ms / wait_max_ms 取连接的平均/最长等待时间，timeouts 等待超过 pool_timeout 的次数
+    """
+    stats = {"worker": os.getpid(), "pools": {}}
+    for key, engine in db.engines.items():
+        pool = engine.pool
+        data = {"url": engine.url.render_as_string(hide_password=True), "pool": type(pool).__name__}
+        if isinstance(pool, QueuePool):
+            data.update(size=pool.size(), checked_out=pool.checkedout(), checked_in=pool.checkedin(),
+                        overflow=pool.overflow(), timeout=pool.timeout())
+        metrics = getattr(pool, "metrics", None)
+        if metrics is not None:
+            data.update(
+                checkouts=metrics.checkouts,
+                peak_checked_out=metrics.peak_checked_out,
+                connects=metrics.connects,
+                invalidated=metrics.invalidated,
+                timeouts=metrics.timeouts,
+                wait_avg_ms=round(metrics.wait_total / metrics.waits * 1000, 3) if metrics.waits else 0,
+                wait_max_ms=round(metrics.wait_max * 1000, 3),
+            )
+        stats["pools"][key or "default"] = data
+    return stats
@@ -0,0 +1,95 @@
+import json
+from datetime import date, datetime
+
+from flask import g, has_request_context
+from flask.json.provider import DefaultJSONProvider
+from werkzeug.http import http_date
+
+try:  # 可选依赖，按 orjson -> msgspec -> 标准库 的顺序选用
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """
+    jsonify / request.get_json 使用的 JSON 编解码器
+    - 中文直接输出为 UTF-8，不转义成 \\uXXXX
+    - 日期按 JSON_DATE_FORMAT 输出："http"（Flask 默认格式，默认值）或 "iso"（2024-05-01 / 2024-05-01T08:00:00）
+    - 与默认实现一样按 key 排序、非调试模式下紧凑输出
+    """
+
+    ensure_ascii = False
+    date_format = "http"
+    encoder = "stdlib"
+
+    def configure(self, encoder="auto", date_format="http"):
+        if encoder == "auto":
+            encoder = "orjson" if orjson else "msgspec" if msgspec else "stdlib"
+        if (encoder == "orjson" and orjson is None) or (encoder == "msgspec" and msgspec is None):
+            raise RuntimeError(f"JSON_ENCODER={encoder} 但未安装 {encoder}")
+        self.encoder = encoder
+        self.date_format = date_format
+        if encoder == "msgspec":
+            self._msgspec_encoder = msgspec.json.Encoder(enc_hook=self._default, order="sorted")
+
+    def _default(self, o):
+        if isinstance(o, date) and self.date_format == "iso":
+            return o.isoformat()
+        if isinstance(o, date) and not isinstance(o, datetime):
+            o = datetime(o.year, o.month, o.day)
+        if isinstance(o, datetime):
+            return http_date(o)
+        return DefaultJSONProvider.default(o)
+
+    def _encode(self, obj, indent=False):
+        """编码为 UTF-8 bytes"""
+        if self.encoder == "orjson":
+            option = orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+            if self.date_format != "iso":
+                option |= orjson.OPT_PASSTHROUGH_DATETIME
+            if indent:
+                option |= orjson.OPT_INDENT_2
+            return orjson.dumps(obj, default=self._default, option=option)
+        if self.encoder == "msgspec" and not indent and self.date_format == "iso":
+            return self._msgspec_encoder.encode(obj)
+        separators = None if indent else (",", ":")
+        return json.dumps(obj, default=self._default, ensure_ascii=False, sort_keys=True,
+                          indent=2 if indent else None, separators=separators).encode("utf-8")
+
+    def dumps(self, obj, **kwargs):
+        if kwargs:
+            # 带自定义参数（如 cls、indent）时交给标准库
+            kwargs.setdefault("default", self._default)
+            kwargs.setdefault("ensure_ascii", False)
+            kwargs.setdefault("sort_keys", True)
+            return json.dumps(obj, **kwargs)
+        return self._encode(obj).decode("utf-8")
+
+    def loads(self, s, **kwargs):
+        if not kwargs and self.encoder == "orjson":
+            return orjson.loads(s)
+        if not kwargs and self.encoder == "msgspec":
+            try:
+                return msgspec.json.decode(s)
+            except msgspec.DecodeError as e:
+                # 与标准库、orjson 一致抛出 ValueError，request.get_json(silent=True) 才能返回 None
+                raise ValueError(str(e)) from e
+        return json.loads(s, **kwargs)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        if isinstance(obj, dict) and has_request_context():
+            # 记录响应体中的业务状态码，@conditional 据此决定是否加 ETag，不必再解析响应体
+            g.response_code = obj.get("code")
+        indent = (self.compact is None and self._app.debug) or self.compact is False
+        return self._app.response_class(self._encode(obj, indent) + b"\n", mimetype=self.mimetype)
+
+
+def init_json_provider(app):
+    app.json = FastJSONProvider(app)
+    app.json.configure(app.config.get("JSON_ENCODER", "auto"), app.config.get("JSON_DATE_FORMAT", "http"))
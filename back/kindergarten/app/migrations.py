@@ -0,0 +1,134 @@
+"""
+带版本号的数据库迁移，SQLite 开发库和 MySQL 生产库使用同一套代码
+
+    flask --app manage.py migrate          执行所有未执行的迁移
+    flask --app manage.py migrate --list   查看各版本的执行状态
+
+新增迁移：在文件末尾用 @migration(下一个版本号, "说明") 注册一个函数，函数在一个事务中执行
+（MySQL 的 DDL 会隐式提交，迁移函数应当可以安全地重复执行，例如建表/建索引时 checkfirst=True）
+多个进程同时迁移时由 migration_lock 依次执行，后执行的进程看到版本已记录后跳过
+"""
+from contextlib import contextmanager
+from datetime import datetime
+
+import click
+from sqlalchemy import inspect, select, text
+
+from .models import db, SchemaMigration, ChildLatestDq, Child, Dq, QuizInfo, Game, TeacherClass, TestDetail
+
+MIGRATIONS = []  # [(版本号, 说明, 函数)]，按版本号升序
+
+
+def migration(version, description):
+    def decorator(func):
+        assert not MIGRATIONS or MIGRATIONS[-1][0] < version, "迁移版本号必须递增"
+        MIGRATIONS.append((version, description, func))
+        return func
+    return decorator
+
+
+def applied_versions(conn):
+    if not inspect(conn).has_table(SchemaMigration.__tablename__):
+        return set()
+    return set(conn.execute(select(SchemaMigration.version)).scalars())
+
+
+# MySQL 命名锁的名称和等待秒数
+MIGRATION_LOCK_NAME = "kindergarten_migrate"
+MIGRATION_LOCK_TIMEOUT = 60
+
+
+@contextmanager
+def migration_lock(conn):
+    """
+    在锁内执行并提交，同一时间只有一个进程在迁移：
+    SQLite 用 BEGIN IMMEDIATE 在事务开始时取得写锁（等待时间为连接的 busy timeout），
+    MySQL 的 DDL 会隐式提交、不能靠事务加锁，使用 GET_LOCK 命名锁
+    """
+    mysql = conn.dialect.name == "mysql"
+    if mysql:
+        acquired = conn.execute(text("SELECT GET_LOCK(:name, :timeout)"),
+                                {"name": MIGRATION_LOCK_NAME, "timeout": MIGRATION_LOCK_TIMEOUT}).scalar()
+        if acquired != 1:
+            raise RuntimeError(f"{MIGRATION_LOCK_TIMEOUT} 秒内未取得迁移锁，可能有其他进程正在迁移")
+    elif conn.dialect.name == "sqlite":
+        conn.exec_driver_sql("BEGIN IMMEDIATE")
+    try:
+        yield
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        if mysql:
+            conn.execute(text("SELECT RELEASE_LOCK(:name)"), {"name": MIGRATION_LOCK_NAME})
+            conn.commit()
+
+
+def upgrade(engine):
+    """
+    按版本号顺序执行未执行的迁移，每个迁移执行成功后记录到 SchemaMigration 表
+    每个迁移在 migration_lock 内重新检查是否已执行，多个worker同时启动时不会重复执行
+
+    :return: 本次执行的 [(版本号, 说明)]
+    """
+    done = []
+    with engine.connect() as conn:
+        with migration_lock(conn):
+            SchemaMigration.__table__.create(conn, checkfirst=True)
+        for version, description, func in MIGRATIONS:
+            with migration_lock(conn):
+                if version in applied_versions(conn):
+                    continue
+                func(conn)
+                conn.execute(SchemaMigration.__table__.insert().values(
+                    version=version, description=description, applied_at=datetime.now()))
+            done.append((version, description))
+    return done
+
+
+@migration(1, "ChildLatestDq：每个学生最近一次测评的分数")
+def create_child_latest_dq(conn):
+    ChildLatestDq.__table__.create(conn, checkfirst=True)
+    # 只补充还没有记录的学生，重复执行（或中途失败后重新执行）不会违反主键约束
+    conn.execute(text("""
+        INSERT INTO ChildLatestDq (child_id, dq_id, gross_motor_score, fine_motor_score, language_score,
+                                   adaptability_score, social_score)
+        SELECT d.child_id, d.dq_id, d.gross_motor_score, d.fine_motor_score, d.language_score,
+               d.adaptability_score, d.social_score
+        FROM Dq d
+        WHERE d.child_id IS NOT NULL
+          AND d.dq_id = (SELECT d2.dq_id FROM Dq d2 WHERE d2.child_id = d.child_id
+                         ORDER BY d2.date DESC, d2.dq_id DESC LIMIT 1)
+          AND NOT EXISTS (SELECT 1 FROM ChildLatestDq l WHERE l.child_id = d.child_id)
+    """))
+
+
+@migration(2, "热点查询使用的二级索引")
+def create_hot_path_indexes(conn):
+    for model in (Child, Dq, QuizInfo, Game, TeacherClass, TestDetail):
+        for index in model.__table__.indexes:
+            index.create(conn, checkfirst=True)
+
+
+def init_migrations(app):
+    @app.cli.command("migrate")
+    @click.option("--list", "show", is_flag=True, help="只显示各版本的执行状态")
+    def migrate_command(show):
+        """执行数据库迁移"""
+        if show:
+            with db.engine.connect() as conn:
+                applied = applied_versions(conn)
+            for version, description, _ in MIGRATIONS:
+                click.echo(f"{'[x]' if version in applied else '[ ]'} {version} {description}")
+            return
+        done = upgrade(db.engine)
+        for version, description in done:
+            click.echo(f"已执行 {version} {description}")
+        if not done:
+            click.echo("数据库已是最新版本")
+
+    if app.config.get("MIGRATE_ON_START", False):
+        # 开发环境启动时自动迁移（多个worker同时启动时由 migration_lock 串行化）；生产环境在部署时执行 migrate
+        with app.app_context():
+            upgrade(db.engine)
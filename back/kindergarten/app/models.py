@@ -1,9 +1,10 @@
 from datetime import datetime
 from flask_sqlalchemy import SQLAlchemy
-from werkzeug.security import generate_password_hash, check_password_hash
+from .password import password_hasher
+from .replica import RoutingSession
 
 
-db = SQLAlchemy()  # 没有参数的实例化数据库对象
+db = SQLAlchemy(session_options={"class_": RoutingSession})  # 只读接口的查询可路由到只读副本，见 replica.py
 
 
 class Admin(db.Model):
@@ -14,10 +15,10 @@ class Admin(db.Model):
     phone = db.Column(db.String(20), nullable=False, unique=True)
     token = db.Column(db.String(512), nullable=True)
     def set_password(self, password):
-        self.pwd = generate_password_hash(password)
+        self.pwd = password_hasher.hash(password)
 
     def check_password(self, password):
-        return check_password_hash(self.pwd, password)
+        return password_hasher.verify(self.pwd, password)
 
 
 class Parent(db.Model):
@@ -30,10 +31,10 @@ class Parent(db.Model):
     children = db.relationship('Child', backref='guardian', foreign_keys='Child.guardian_id')
 
     def set_password(self, password):
-        self.pwd = generate_password_hash(password)
+        self.pwd = password_hasher.hash(password)
 
     def check_password(self, password):
-        return check_password_hash(self.pwd, password)
+        return password_hasher.verify(self.pwd, password)
 
 
 class Class(db.Model):
@@ -63,14 +64,17 @@ class Teacher(db.Model):
     assessments = db.relationship('Dq', backref='teacher')
 
     def set_password(self, password):
-        self.pwd = generate_password_hash(password)
+        self.pwd = password_hasher.hash(password)
 
     def check_password(self, password):
-        return check_password_hash(self.pwd, password)
+        return password_hasher.verify(self.pwd, password)
 
 
 class TeacherClass(db.Model):
     __tablename__ = 'Teacher_Class'
+    __table_args__ = (
+        db.Index('ix_Teacher_Class_class_id', 'class_id'),
+    )
 
     teacher_id = db.Column(db.Integer, db.ForeignKey('Teacher.teacher_id'), primary_key=True)
     class_id = db.Column(db.Integer, db.ForeignKey('Class.class_id'), primary_key=True)
@@ -79,6 +83,10 @@ class TeacherClass(db.Model):
 
 class Child(db.Model):
     __tablename__ = 'Child'
+    __table_args__ = (
+        db.Index('ix_Child_class_id', 'class_id'),
+        db.Index('ix_Child_guardian_id', 'guardian_id'),
+    )
 
     child_id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     child_name = db.Column(db.String(50), nullable=False)
@@ -95,6 +103,9 @@ class Child(db.Model):
 
 class QuizInfo(db.Model):
     __tablename__ = 'QuizInfo'
+    __table_args__ = (
+        db.Index('ix_QuizInfo_month_age_sort', 'month_age', 'sort'),
+    )
 
     quiz_id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     quiz_name = db.Column(db.String(100), nullable=False)
@@ -108,6 +119,9 @@ class QuizInfo(db.Model):
 
 class Dq(db.Model):
     __tablename__ = 'Dq'
+    __table_args__ = (
+        db.Index('ix_Dq_child_id_date', 'child_id', 'date'),
+    )
 
     dq_id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     month_age = db.Column(db.Integer, nullable=False)
@@ -125,8 +139,24 @@ class Dq(db.Model):
     test_details = db.relationship('TestDetail', backref='assessment')
 
 
+class ChildLatestDq(db.Model):
+    """每个学生最近一次测评的分数，recordScore 在同一事务中更新，测评前页面只需读一行"""
+    __tablename__ = 'ChildLatestDq'
+
+    child_id = db.Column(db.Integer, db.ForeignKey('Child.child_id'), primary_key=True)
+    dq_id = db.Column(db.Integer, db.ForeignKey('Dq.dq_id'), nullable=False)
+    gross_motor_score = db.Column(db.Float, default=0)
+    fine_motor_score = db.Column(db.Float, default=0)
+    language_score = db.Column(db.Float, default=0)
+    adaptability_score = db.Column(db.Float, default=0)
+    social_score = db.Column(db.Float, default=0)
+
+
 class TestDetail(db.Model):
     __tablename__ = 'TestDetail'
+    __table_args__ = (
+        db.Index('ix_TestDetail_quiz_id', 'quiz_id'),
+    )
 
     dq_id = db.Column(db.Integer, db.ForeignKey('Dq.dq_id'), primary_key=True)
     quiz_id = db.Column(db.Integer, db.ForeignKey('QuizInfo.quiz_id'), primary_key=True)
@@ -135,6 +165,9 @@ class TestDetail(db.Model):
 
 class Game(db.Model):
     __tablename__ = 'Game'
+    __table_args__ = (
+        db.Index('ix_Game_sort_begin_end', 'game_sort', 'game_beginTime', 'game_endTime'),
+    )
 
     game_id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     game_name = db.Column(db.String(255), nullable=False)
@@ -148,6 +181,15 @@ class Game(db.Model):
     cautions = db.Column(db.Text, nullable=False)
 
 
+class SchemaMigration(db.Model):
+    """已执行的数据库迁移版本，见 app/migrations.py"""
+    __tablename__ = 'SchemaMigration'
+
+    version = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    description = db.Column(db.String(255), nullable=False)
+    applied_at = db.Column(db.DateTime, nullable=False, default=datetime.now)
+
+
 if __name__ == '__main__':
     db.create_all()
     # db.drop_all()
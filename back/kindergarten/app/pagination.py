@@ -0,0 +1,103 @@
+import base64
+import json
+from bisect import bisect_right
+from datetime import date, datetime
+
+from flask import request
+from sqlalchemy import tuple_
+
+from .models import db
+
+# 每页条数的默认值和上限
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+def encode_cursor(values):
+    """把最后一行的排序键编码成不透明的游标字符串"""
+    values = [v.isoformat() if isinstance(v, date) else v for v in values]
+    return base64.urlsafe_b64encode(json.dumps(values, separators=(",", ":")).encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor, columns):
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        if not isinstance(values, list) or len(values) != len(columns):
+            raise ValueError
+        result = []
+        for column, value in zip(columns, values):
+            python_type = column.type.python_type
+            if python_type is datetime:
+                value = datetime.fromisoformat(value)
+            elif python_type is date:
+                value = date.fromisoformat(value)
+            result.append(value)
+        return result
+    except (ValueError, TypeError, UnicodeError):  # binascii.Error 是 ValueError 的子类
+        raise ValueError("cursor无效")
+
+
+def page_args():
+    """
+    读取分页参数 limit / cursor
+    两者都没有时返回 (None, None)，接口按旧方式返回全部数据
+    """
+    limit = request.args.get('limit')
+    cursor = request.args.get('cursor')
+    if limit is None and cursor is None:
+        return None, None
+    limit = DEFAULT_PAGE_SIZE if limit is None else int(limit)
+    return min(max(limit, 1), MAX_PAGE_SIZE), cursor or None
+
+
+def keyset_page(stmt, columns, limit, cursor):
+    """
+    按 columns（唯一且有索引的排序键，如主键）做游标分页，每页的耗时与翻到第几页无关
+
+    :param stmt: select 语句（选择的列中需包含排序键），不需要 order_by
+    :param columns: 排序键列，升序
+    :return: (本页的行, next_cursor)，没有下一页时 next_cursor 为 None
+    """
+    if cursor:
+        values = decode_cursor(cursor, columns)
+        if len(columns) == 1:
+            stmt = stmt.where(columns[0] > values[0])
+        else:
+            stmt = stmt.where(tuple_(*columns) > tuple_(*values))
+    rows = db.session.execute(stmt.order_by(*columns).limit(limit + 1)).all()
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor([getattr(rows[-1], column.key) for column in columns])
+
+
+def fetch_page(stmt, columns):
+    """
+    执行列表查询：请求中没有 limit/cursor 时返回全部行（兼容旧客户端），否则按游标返回一页
+
+    :return: (行, next_cursor)
+    """
+    limit, cursor = page_args()
+    if limit is None:
+        return db.session.execute(stmt).all(), None
+    return keyset_page(stmt, columns, limit, cursor)
+
+
+def slice_page(items, key, column):
+    """
+    与 fetch_page 参数、游标格式相同，用于已缓存在内存中、按 key 升序排列的数据
+
+    :param key: 取排序键的函数，排序键对应 column 列
+    :return: (本页数据, next_cursor)
+    """
+    limit, cursor = page_args()
+    if limit is None:
+        return items, None
+    start = 0
+    if cursor:
+        value, = decode_cursor(cursor, [column])
+        start = bisect_right(items, value, key=key)
+    page = items[start:start + limit]
+    if start + limit >= len(items):
+        return page, None
+    return page, encode_cursor([key(page[-1])])
@@ -0,0 +1,93 @@
+import atexit
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from threading import Lock
+
+from werkzeug.security import generate_password_hash, check_password_hash
+
+
+class PasswordPoolBusy(Exception):
+    """密码校验进程池已满或等待超时，调用方应直接返回503"""
+
+
+class PasswordHasher:
+    """
+    把 CPU 密集的密码哈希计算放到有界进程池中执行
+    进程池在每个 gunicorn worker 第一次使用时才创建，等待中的任务数超过上限时直接拒绝
+    workers=0 时在当前进程内同步计算
+    """
+
+    def __init__(self, method="scrypt", workers=0, max_pending=8, timeout=10):
+        self.method = method
+        self.workers = workers
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self._prefix = None
+        self._pool = None
+        self._pending = 0
+        self._lock = Lock()
+
+    def configure(self, method, workers, max_pending, timeout):
+        self.shutdown()
+        self.method = method
+        self.workers = workers
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self._prefix = None
+
+    def _get_pool(self):
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.workers)
+        return self._pool
+
+    def _release(self, future):
+        with self._lock:
+            self._pending -= 1
+
+    def _run(self, func, *args):
+        if self.workers <= 0:
+            return func(*args)
+        with self._lock:
+            if self._pending >= self.max_pending:
+                raise PasswordPoolBusy("密码校验队列已满")
+            self._pending += 1
+            try:
+                future = self._get_pool().submit(func, *args)
+            except Exception:
+                self._pending -= 1
+                raise
+        future.add_done_callback(self._release)
+        try:
+            return future.result(timeout=self.timeout)
+        except TimeoutError:
+            future.cancel()
+            raise PasswordPoolBusy("密码校验超时")
+
+    def hash(self, password):
+        return self._run(generate_password_hash, password, self.method)
+
+    def verify(self, pwhash, password):
+        return self._run(check_password_hash, pwhash, password)
+
+    def needs_rehash(self, pwhash):
+        """哈希参数与当前配置不一致时返回 True，登录成功后据此透明地重新计算哈希"""
+        if self._prefix is None:
+            self._prefix = generate_password_hash("", self.method).split("$", 1)[0]
+        return pwhash.split("$", 1)[0] != self._prefix
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+
+password_hasher = PasswordHasher()
+atexit.register(password_hasher.shutdown)
+
+
+def init_password_hasher(app):
+    password_hasher.configure(
+        app.config.get("PASSWORD_HASH_METHOD", "scrypt"),
+        app.config.get("PASSWORD_POOL_WORKERS", 0),
+        app.config.get("PASSWORD_POOL_MAX_PENDING", 8),
+        app.config.get("PASSWORD_POOL_TIMEOUT", 10),
+    )
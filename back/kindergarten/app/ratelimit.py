@@ -0,0 +1,145 @@
+import os
+import sqlite3
+import time
+from collections import deque
+from threading import Lock
+
+# 每记录多少次失败清理一次所有过期记录，避免大量不同手机号/IP的失败记录一直留在内存或数据库中
+PRUNE_EVERY = 256
+
+
+class MemoryStore:
+    """进程内的滑动窗口存储，key -> 失败时间戳队列"""
+
+    def __init__(self):
+        self._data = {}
+        self._lock = Lock()
+        self._adds = 0
+
+    def count(self, key, since):
+        with self._lock:
+            attempts = self._data.get(key)
+            if not attempts:
+                return 0
+            while attempts and attempts[0] < since:
+                attempts.popleft()
+            if not attempts:
+                del self._data[key]
+            return len(attempts)
+
+    def add(self, key, now, since):
+        with self._lock:
+            attempts = self._data.setdefault(key, deque())
+            while attempts and attempts[0] < since:
+                attempts.popleft()
+            attempts.append(now)
+            self._adds += 1
+            if self._adds % PRUNE_EVERY == 0:
+                self._prune(since)
+
+    def _prune(self, since):
+        # 最近一次失败也已超出窗口的 key 整个删除
+        for key in [key for key, attempts in self._data.items() if attempts[-1] < since]:
+            del self._data[key]
+
+    def reset(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+
+class SQLiteStore:
+    """基于SQLite文件的滑动窗口存储，同一台机器上的多个 gunicorn worker 共享"""
+
+    def __init__(self, path):
+        self.path = path
+        self._adds = 0
+        self._execute(
+            ("CREATE TABLE IF NOT EXISTS login_attempt (key TEXT NOT NULL, ts REAL NOT NULL)", ()),
+            ("CREATE INDEX IF NOT EXISTS ix_login_attempt_key_ts ON login_attempt (key, ts)", ()),
+        )
+
+    def _execute(self, *statements):
+        conn = sqlite3.connect(self.path, timeout=5)
+        try:
+            with conn:
+                for sql, params in statements:
+                    row = conn.execute(sql, params).fetchone()
+            return row
+        finally:
+            conn.close()
+
+    def count(self, key, since):
+        return self._execute(("SELECT COUNT(*) FROM login_attempt WHERE key = ? AND ts >= ?", (key, since)))[0]
+
+    def add(self, key, now, since):
+        statements = [
+            ("DELETE FROM login_attempt WHERE key = ? AND ts < ?", (key, since)),
+            ("INSERT INTO login_attempt (key, ts) VALUES (?, ?)", (key, now)),
+        ]
+        self._adds += 1
+        if self._adds % PRUNE_EVERY == 0:
+            statements.append(("DELETE FROM login_attempt WHERE ts < ?", (since,)))
+        self._execute(*statements)
+
+    def reset(self, key):
+        self._execute(("DELETE FROM login_attempt WHERE key = ?", (key,)))
+
+
+class LoginLimiter:
+    """
+    登录失败次数的滑动窗口限流，按手机号和客户端IP分别计数
+    在校验密码之前调用 allow()，被拒绝的请求不会产生任何哈希计算
+    """
+
+    def __init__(self, store=None, phone_limit=5, ip_limit=20, window=300):
+        self.store = store or MemoryStore()
+        self.phone_limit = phone_limit
+        self.ip_limit = ip_limit
+        self.window = window
+        self.hits = 0  # 被限流拒绝的次数
+        self.misses = 0  # 放行的次数
+
+    def allow(self, phone, ip):
+        since = time.time() - self.window
+        blocked = (self.store.count(f"phone:{phone}", since) >= self.phone_limit
+                   or self.store.count(f"ip:{ip}", since) >= self.ip_limit)
+        if blocked:
+            self.hits += 1
+        else:
+            self.misses += 1
+        return not blocked
+
+    def record_failure(self, phone, ip):
+        now = time.time()
+        since = now - self.window
+        self.store.add(f"phone:{phone}", now, since)
+        self.store.add(f"ip:{ip}", now, since)
+
+    def reset(self, phone):
+        """登录成功后清空该手机号的失败记录"""
+        self.store.reset(f"phone:{phone}")
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "phone_limit": self.phone_limit,
+            "ip_limit": self.ip_limit,
+            "window": self.window,
+            "store": type(self.store).__name__,
+        }
+
+
+login_limiter = LoginLimiter()
+
+
+def init_login_limiter(app):
+    if app.config.get("LOGIN_LIMIT_STORE", "memory") == "sqlite":
+        store = SQLiteStore(app.config.get("LOGIN_LIMIT_SQLITE_PATH")
+                            or os.path.join(os.path.dirname(app.root_path), "db/login_limit.db"))
+    else:
+        store = MemoryStore()
+    login_limiter.store = store
+    login_limiter.phone_limit = app.config.get("LOGIN_LIMIT_PHONE", 5)
+    login_limiter.ip_limit = app.config.get("LOGIN_LIMIT_IP", 20)
+    login_limiter.window = app.config.get("LOGIN_LIMIT_WINDOW", 300)
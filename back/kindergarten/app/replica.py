@@ -0,0 +1,77 @@
+"""
+只读副本：SQLALCHEMY_BINDS 中配置了 "replica" 时，用 @read_replica 标记的只读接口查询副本，其余查询和所有写入走主库
+副本有复制延迟，同一用户（或同一IP）提交写入后 REPLICA_STICKY_SECONDS 秒内的请求仍查询主库，保证读到自己刚写入的数据
+（记录存放在应用缓存中，多个worker需使用 sqlite/redis 缓存后端才能共享）
+"""
+from functools import wraps
+
+from flask import current_app, g, has_request_context, request
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+from sqlalchemy.sql.dml import UpdateBase
+
+from .cache import cache
+
+REPLICA_BIND = "replica"
+
+
+def replica_enabled():
+    return REPLICA_BIND in (current_app.config.get("SQLALCHEMY_BINDS") or {})
+
+
+def sticky_seconds():
+    return current_app.config.get("REPLICA_STICKY_SECONDS", 5)
+
+
+def _identities():
+    """写入者的标识：已登录时为 角色:用户id，另外总是包括IP（登录等没有用户信息的写入）"""
+    identities = [f"ip:{request.remote_addr}"]
+    if g.get("user_id") is not None:
+        identities.append(f"{g.role}:{g.user_id}")
+    return identities
+
+
+def recently_wrote():
+    return any(cache.get(f"replica_sticky:{identity}") for identity in _identities())
+
+
+class RoutingSession(Session):
+    """
+    在 Flask-SQLAlchemy 按 bind_key 选择 engine 的基础上，把只读接口中的查询发到只读副本；
+    flush、INSERT/UPDATE/DELETE 和 SELECT ... FOR UPDATE 始终使用主库
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if (bind is None and not self._flushing and has_request_context() and g.get("db_replica", False)
+                and not isinstance(clause, UpdateBase) and getattr(clause, "_for_update_arg", None) is None):
+            return self._db.engines[REPLICA_BIND]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+@event.listens_for(RoutingSession, "after_flush")
+def _after_flush(session, flush_context):
+    session.info["wrote"] = True
+
+
+@event.listens_for(RoutingSession, "after_commit")
+def _after_commit(session):
+    if session.info.pop("wrote", False) and has_request_context() and replica_enabled():
+        for identity in _identities():
+            cache.set(f"replica_sticky:{identity}", True, ttl=sticky_seconds())
+
+
+@event.listens_for(RoutingSession, "after_rollback")
+def _after_rollback(session):
+    session.info.pop("wrote", None)
+
+
+def read_replica(view):
+    """
+    只读接口的装饰器，放在 require_role / conditional 之后：
+    鉴权查询仍走主库，接口内的查询在没有近期写入时走只读副本
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        g.db_replica = replica_enabled() and not recently_wrote()
+        return view(*args, **kwargs)
+    return wrapper
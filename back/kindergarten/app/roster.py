@@ -0,0 +1,51 @@
+from flask import current_app
+from sqlalchemy import select
+
+from .cache import cache
+from .models import db, Class, Child, Teacher, TeacherClass
+
+
+def class_roster(class_id):
+    """
+    班级花名册：班级名称、任课教师 (teacher_id, 姓名)、学生 (child_id, 姓名, 性别)，学生按 child_id 排序
+    存放在应用缓存中，学生或教师-班级关联变化时由写接口调用 invalidate_roster 失效
+    缓存后端不共享（memory）时失效通知不到其他worker，不缓存，每次查库
+
+    :return: dict，班级不存在时返回 None
+    """
+    key = f"roster:{int(class_id)}"
+    roster = cache.get(key) if cache.shared else None
+    if roster is None:
+        class_info = db.session.get(Class, class_id)
+        if class_info is None:
+            return None
+        teachers = db.session.execute(
+            select(Teacher.teacher_id, Teacher.teacher_name)
+            .join(TeacherClass, Teacher.teacher_id == TeacherClass.teacher_id)
+            .where(TeacherClass.class_id == class_id)
+        ).all()
+        students = db.session.execute(
+            select(Child.child_id, Child.child_name, Child.gender)
+            .where(Child.class_id == class_id)
+            .order_by(Child.child_id)
+        ).all()
+        roster = {
+            "class_id": class_info.class_id,
+            "class_name": class_info.class_name,
+            "teachers": tuple((row.teacher_id, row.teacher_name) for row in teachers),
+            "students": tuple((row.child_id, row.child_name, row.gender) for row in students),
+        }
+        if cache.shared:
+            cache.set(key, roster, ttl=current_app.config.get('ROSTER_CACHE_TTL', 600), tags=("roster",))
+    return roster
+
+
+def invalidate_roster(*class_ids):
+    """
+    学生增删、转班、班级改名/删除、教师-班级关联变化后调用；不传参数时清空所有班级
+    """
+    if not class_ids:
+        cache.delete_tag("roster")
+    for class_id in class_ids:
+        if class_id is not None:
+            cache.delete(f"roster:{int(class_id)}")
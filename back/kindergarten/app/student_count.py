@@ -0,0 +1,41 @@
+"""
+班级人数 Class.student_count：由数据库中 Child 表上的触发器维护（update_class_count_insert/update/delete，
+定义见 back/sql/数据库表.md），写接口不需要再修改人数，班级列表直接读取该列
+
+人数与 Child 表不一致时（手工改库、触发器缺失期间写入的数据）执行一次校正：
+    flask --app manage.py reconcile-student-count
+"""
+import click
+from sqlalchemy import func, select, update
+
+from .models import db, Class, Child
+from .versions import bump_version
+
+
+def reconcile_student_counts(conn):
+    """
+    按 Child 表重新统计所有班级的人数，只更新不一致的班级
+    :return: 更新的班级数
+    """
+    actual = (
+        select(func.count(Child.child_id))
+        .where(Child.class_id == Class.class_id)
+        .scalar_subquery()
+    )
+    result = conn.execute(
+        update(Class)
+        .where(Class.student_count != actual)
+        .values(student_count=actual)
+    )
+    return result.rowcount
+
+
+def init_student_count(app):
+    @app.cli.command("reconcile-student-count")
+    def reconcile_command():
+        """按学生表校正班级人数"""
+        with db.engine.begin() as conn:
+            fixed = reconcile_student_counts(conn)
+        if fixed:
+            bump_version("class")
+        click.echo(f"已校正 {fixed} 个班级的人数")
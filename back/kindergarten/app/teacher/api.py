@@ -1,9 +1,10 @@
 import os
 
-from flask import request, jsonify, make_response, send_file, current_app
+from flask import request, jsonify, make_response, send_file, current_app, g
 from datetime import datetime, date, timedelta
+from sqlalchemy import select
 from . import teacher
-from ..models import db, Child, Dq, QuizInfo, TestDetail, TeacherClass, Teacher, Class, Parent, Admin, Game
+from ..models import db, Child, Dq, QuizInfo, TestDetail, TeacherClass, Teacher, Class, Parent, Admin, ChildLatestDq
 
 from reportlab.lib.pagesizes import A4
 from reportlab.platypus import SimpleDocTemplate, Paragraph, Table, TableStyle, Spacer
@@ -12,45 +13,30 @@ from reportlab.lib import colors
 from reportlab.lib.units import cm
 from reportlab.pdfbase import pdfmetrics
 from reportlab.pdfbase.ttfonts import TTFont
-from ..auth import verify_token_and_get_user
+from ..catalog import quiz_catalog, game_catalog, GameRecord
+from ..versions import conditional, bump_version, table_version
+from ..cache import cache, MemoryBackend
+from ..pagination import fetch_page, slice_page
+from ..roster import class_roster, invalidate_roster
+from ..replica import read_replica
+from ..ageband import TEST_MONTHS, exact_month_age, whole_month_age, test_band, step_band, batch_month_ages
+from ..auth import (require_role, token_cache, identity_index, teacher_class_ids, invalidate_teacher_classes,
+                    EXPERIENCE_CLASS_ID, ADMIN_DENIED)
 
 @teacher.route("/changeRole", methods=["POST"])
+@require_role("admin", "园长")
 def changeRole():
     # 获取请求参数
     data = request.get_json()
     teacher_id = data.get("teacher_id")
     manager_id = data.get("manager_id")
     is_set = data.get("is_set")
-    uniquetoken = data.get('uniquetoken')  # 新增：获取uniquetoken
 
     # 参数校验
     if not all([teacher_id, manager_id, is_set is not None]):
         return jsonify({"code": 400, "message": "参数不完整", "data": []})
 
     try:
-        # --- 新增的Token验证逻辑 ---
-        user, user_role = verify_token_and_get_user(teacher_id, uniquetoken)
-        if not user:
-            return jsonify({
-                "code": 403,
-                "message": "Token mismatch, potential new device login.",
-                "data": None
-            })
-        # --- Token验证结束 ---
-
-
-        # 检查园长权限，再检查管理员权限
-        manager_teacher = Teacher.query.get(manager_id)
-        manager_admin = Admin.query.get(manager_id)
-        has_permission = False
-        if manager_teacher and manager_teacher.role == "园长":
-            has_permission = True
-        elif manager_admin:
-            has_permission = True
-
-        if not has_permission:
-            return jsonify({"code": 400, "message": "没有操作权限", "data": []})
-
         # 检查是否尝试修改自己的角色
         if teacher_id == manager_id:
             return jsonify({"code": 400, "message": "没有操作权限", "data": []})
@@ -70,6 +56,8 @@ def changeRole():
 
         # 提交到数据库
         db.session.commit()
+        token_cache.invalidate_user(teacher_id)
+        bump_version("teacher")
 
         return jsonify({"code": 200, "message": "角色修改成功", "data": []})
 
@@ -79,58 +67,38 @@ def changeRole():
 
 
 @teacher.route("/changeChildClass", methods=["POST"])
+@require_role("admin", "园长")
 def changeChildClass():
     # 获取请求参数
     data = request.get_json()
     child_id = data.get("child_id")
     class_id = data.get("class_id")
     manager_id = data.get("manager_id")
-    uniquetoken = data.get('uniquetoken')  # 新增：获取uniquetoken
     # 验证必要参数是否存在
     if not all([child_id, class_id, manager_id]):
         return jsonify({"code": 400, "message": "缺少必要参数", "data": []})
 
     try:
-
-        # --- 新增的Token验证逻辑 ---
-        user, user_role = verify_token_and_get_user(manager_id, uniquetoken)
-        if not user:
-            return jsonify({
-                "code": 403,
-                "message": "Token mismatch, potential new device login.",
-                "data": None
-            })
-        # --- Token验证结束 ---
-
-        # 1. 检查园长权限，再检查管理员权限
-        manager_teacher = Teacher.query.get(manager_id)
-        manager_admin = Admin.query.get(manager_id)
-        has_permission = False
-        if manager_teacher and manager_teacher.role == "园长":
-            has_permission = True
-        elif manager_admin:
-            has_permission = True
-
-        if not has_permission:
-            return jsonify({"code": 400, "message": "没有操作权限", "data": []})
-
-        # 2. 检查孩子是否存在
+        # 1. 检查孩子是否存在
         child = Child.query.get(child_id)
         if not child:
             return jsonify({"code": 400, "message": "孩子不存在", "data": []})
 
-        # 3. 检查班级是否存在
+        # 2. 检查班级是否存在
         new_class = Class.query.get(class_id)
         if not new_class:
             return jsonify({"code": 400, "message": "班级不存在", "data": []})
 
-        # 4. 检查孩子是否已经在目标班级
+        # 3. 检查孩子是否已经在目标班级
         if child.class_id == class_id:
             return jsonify({"code": 400, "message": "孩子已在目标班级", "data": []})
 
-        # 5. 执行班级变更
+        # 4. 执行班级变更
+        old_class_id = child.class_id
         child.class_id = class_id
         db.session.commit()
+        invalidate_roster(old_class_id, class_id)
+        bump_version("child")
 
         return jsonify({"code": 200, "message": "success", "data": []})
 
@@ -140,42 +108,19 @@ def changeChildClass():
 
 
 @teacher.route("/changeTeacherClass", methods=["POST"])
+@require_role("admin", "园长")
 def changeTeacherClass():
     data = request.get_json()
     teacher_id = data.get('teacher_id')
     class_info = data.get('class_id', [])  # [[class_id, is_headTeacher], ...]
     manager_id = data.get('manager_id')
-    uniquetoken = data.get('uniquetoken')
 
     # 1. 参数验证
     if not all([teacher_id, class_info, manager_id is not None]):
         return jsonify({"code": 400, "message": "缺少必要参数", "data": []})
 
     try:
-
-        # --- 新增的Token验证逻辑 ---
-        user, user_role = verify_token_and_get_user(manager_id, uniquetoken)
-        if not user:
-            return jsonify({
-                "code": 403,
-                "message": "Token mismatch, potential new device login.",
-                "data": None
-            })
-        # --- Token验证结束 ---
-
-        # 2. 检查园长权限，再检查管理员权限
-        manager_teacher = Teacher.query.get(manager_id)
-        manager_admin = Admin.query.get(manager_id)
-        has_permission = False
-        if manager_teacher and manager_teacher.role == "园长":
-            has_permission = True
-        elif manager_admin:
-            has_permission = True
-
-        if not has_permission:
-            return jsonify({"code": 400, "message": "没有操作权限", "data": []})
-
-        # 3. 检查老师和班级是否存在
+        # 2. 检查老师和班级是否存在
         teacher = Teacher.query.get(teacher_id)
         if not teacher:
             return jsonify({"code": 400, "message": "老师不存在", "data": []})
@@ -186,10 +131,10 @@ def changeTeacherClass():
         if len(existing_classes) != len(class_ids):
             return jsonify({"code": 400, "message": "部分班级不存在", "data": []})
 
-        # 4. 删除老师原有的班级关联
+        # 3. 删除老师原有的班级关联
         TeacherClass.query.filter_by(teacher_id=teacher_id).delete()
 
-        # 5. 添加新的班级关联
+        # 4. 添加新的班级关联
         new_relations = [
             TeacherClass(
                 teacher_id=teacher_id,
@@ -201,6 +146,9 @@ def changeTeacherClass():
         db.session.bulk_save_objects(new_relations)
 
         db.session.commit()
+        invalidate_teacher_classes(teacher_id)
+        invalidate_roster()  # 原来所在的班级和新班级
+        bump_version("teacher_class")
         return jsonify({"code": 200, "message": "success", "data": []})
     except Exception as e:
         db.session.rollback()
@@ -208,51 +156,29 @@ def changeTeacherClass():
 
 
 @teacher.route("/changeClassName", methods=["POST"])
+@require_role("admin", "园长")
 def changeClassName():
     # 获取请求参数
     data = request.get_json()
     class_id = data.get('class_id')
     new_class_name = data.get('class_name')
     manager_id = data.get('manager_id')
-    uniquetoken = data.get('uniquetoken')
 
     # 参数校验
     if not all([class_id, new_class_name, manager_id]):
         return jsonify({"code": 400, "message": "缺少必要参数", "data": []})
 
     try:
-        # --- 新增的Token验证逻辑 ---
-        user, user_role = verify_token_and_get_user(manager_id, uniquetoken)
-        if not user:
-            return jsonify({
-                "code": 403,
-                "message": "Token mismatch, potential new device login.",
-                "data": None
-            })
-        # --- Token验证结束 ---
-
         # 1. 检查班级是否存在
         class_to_update = Class.query.get(class_id)
         if not class_to_update:
             return jsonify({"code": 400, "message": "班级不存在", "data": []})
 
-
-
-        # 2. 检查园长权限，再检查管理员权限
-        manager_teacher = Teacher.query.get(manager_id)
-        manager_admin = Admin.query.get(manager_id)
-        has_permission = False
-        if manager_teacher and manager_teacher.role == "园长":
-            has_permission = True
-        elif manager_admin:
-            has_permission = True
-
-        if not has_permission:
-            return jsonify({"code": 400, "message": "没有操作权限", "data": []})
-
-        # 3. 更新班级名称
+        # 2. 更新班级名称
         class_to_update.class_name = new_class_name
         db.session.commit()
+        invalidate_roster(class_id)
+        bump_version("class")
 
         return jsonify({
             "code": 200,
@@ -269,42 +195,47 @@ def changeClassName():
         })
 
 
+def experience_class():
+    """
+    体验班信息，缓存到 Class 表的版本号变化（改名、删除班级）为止
+    缓存后端不共享（memory）时其他worker的修改不会更新版本号，不缓存，每次查库
+    :return: {"class_id", "class_name"}，体验班不存在时为 None
+    """
+    key = f"experience_class:{table_version('class')}" if cache.shared else None
+    cached = cache.get(key) if key else None
+    if cached is None:
+        row = db.session.execute(
+            select(Class.class_id, Class.class_name).where(Class.class_id == EXPERIENCE_CLASS_ID)).first()
+        cached = {"class_id": row.class_id, "class_name": row.class_name} if row else {}
+        if key:
+            cache.set(key, cached, ttl=24 * 3600)
+    return cached or None
+
+
 @teacher.route("/getClass", methods=["GET"])
+@require_role(id_field="teacher_id")
+@conditional("class", "teacher_class")
 def getClass():
     # 获取前端发送的JSON数据
     teacher_id = request.args.get('teacher_id')
-    uniquetoken = request.args.get('uniquetoken')
     try:
-        # --- 新增的Token验证逻辑 ---
-        user, user_role = verify_token_and_get_user(teacher_id, uniquetoken)
-        if not user:
-            return jsonify({
-                "code": 403,
-                "message": "Token mismatch, potential new device login.",
-                "data": None
-            })
-        # --- Token验证结束 ---
-
-        # 查询Teacher_Class表中该teacher_id对应的所有记录
-        teacher_classes = TeacherClass.query.filter_by(teacher_id=teacher_id).all()
-
-        # 获取所有关联班级的详细信息
-        class_list = []
-        for tc in teacher_classes:
-            class_info = Class.query.get(tc.class_id)
-            if class_info:
-                class_list.append({
-                    "class_id": class_info.class_id,
-                    "class_name": class_info.class_name
-                })
-
-        # 加入体验班，因为每个老师都能测试体验班(class_id=1)
-        experience_class = Class.query.get(1)
-        if experience_class:
-            class_list.append({
-                "class_id": experience_class.class_id,
-                "class_name": experience_class.class_name
-            })
+        # 该老师所在的班级（一次联表查询），加上体验班，因为每个老师都能测试体验班(class_id=1)
+        rows = db.session.execute(
+            select(Class.class_id, Class.class_name)
+            .join(TeacherClass, TeacherClass.class_id == Class.class_id)
+            .where(TeacherClass.teacher_id == teacher_id, Class.class_id != EXPERIENCE_CLASS_ID)
+            .order_by(Class.class_id)
+        ).all()
+        class_list = [
+            {
+                "class_id": row.class_id,
+                "class_name": row.class_name
+            }
+            for row in rows
+        ]
+        experience = experience_class()
+        if experience:
+            class_list.append(experience)
 
         return jsonify({
             "code": 200,
@@ -320,31 +251,24 @@ def getClass():
 
 
 @teacher.route("/getClassChild", methods=["GET"])
+@require_role(id_field="teacher_id")
+@conditional("child")
 def getChild():
     class_id = request.args.get('class_id')
-    teacher_id = request.args.get('teacher_id')
-    uniquetoken = request.args.get('uniquetoken')
     try:
-        # --- 新增的Token验证逻辑 ---
-        user, user_role = verify_token_and_get_user(teacher_id, uniquetoken)
-        if not user:
-            return jsonify({
-                "code": 403,
-                "message": "Token mismatch, potential new device login.",
-                "data": None
-            })
-        # --- Token验证结束 ---
-
-        # Query to get all students in the specified class
-        students = Child.query.filter_by(class_id=class_id).all()
+        # 班级花名册（缓存），可选 limit/cursor 按 child_id 分页
+        roster = class_roster(class_id)
+        students = roster["students"] if roster else ()
+        students, next_cursor = slice_page(students, lambda student: student[0], Child.child_id)
 
         # Create a list of student dictionaries with id and name
-        student_list = [{"id": student.child_id, "name": student.child_name} for student in students]
+        student_list = [{"id": child_id, "name": name} for child_id, name, _ in students]
 
         return jsonify({
             "code": 200,
             "message": "成功获取班级内学生信息",
-            "data": student_list
+            "data": student_list,
+            "next_cursor": next_cursor
         })
 
     except Exception as e:
@@ -355,69 +279,80 @@ def getChild():
         })
 
 
+@teacher.route("/getClassTestAge", methods=["GET"])
+@require_role("admin", "teacher", id_field="teacher_id")
+def getClassTestAge():
+    """
+    班级内所有学生当前的月龄和主测月龄，一次批量计算
+    管理员和园长可以查看任意班级，其他教师只能查看自己的班级
+    """
+    try:
+        class_id = int(request.args.get('class_id'))
+        is_manager = g.permissions & {"admin", "园长"}
+        if not is_manager and class_id not in teacher_class_ids(g.user_id):
+            return jsonify({"code": 400, "message": "没有操作权限", "data": []})
+
+        students = db.session.query(Child.child_id, Child.child_name, Child.birth_date) \
+            .filter(Child.class_id == class_id).order_by(Child.child_id).all()
+        exact, whole, band = batch_month_ages([student.birth_date for student in students])
+
+        student_list = [
+            {
+                "id": student.child_id,
+                "name": student.child_name,
+                "month_age": float(exact[i]),
+                "whole_month_age": int(whole[i]),
+                "test_age": int(band[i])
+            }
+            for i, student in enumerate(students)
+        ]
+
+        return jsonify({
+            "code": 200,
+            "message": "成功获取班级内学生月龄",
+            "data": student_list
+        })
+
+    except Exception as e:
+        return jsonify({
+            "code": 400,
+            "message": f"获取班级内学生月龄失败: {str(e)}",
+            "data": []
+        })
+
+
 @teacher.route("/test", methods=["POST"])
+@require_role(id_field="teacher_id")
 def test():
     try:
-        teacher_id = request.args.get('teacher_id')
-        uniquetoken = request.args.get('uniquetoken')
-        # --- 新增的Token验证逻辑 ---
-        user, user_role = verify_token_and_get_user(teacher_id, uniquetoken)
-        if not user:
-            return jsonify({
-                "code": 403,
-                "message": "Token mismatch, potential new device login.",
-                "data": None
-            })
-        # --- Token验证结束 ---
-
         # 获取前端发送的JSON数据
         data = request.get_json()
         child_id = data["child_id"]
         # child_id = request.args.get('child_id')
 
-        # 获取该学生对象
-        child = Child.query.get(child_id)
+        # 学生的出生日期和最近一次测试的分数，按主键一次读取
+        child = db.session.execute(
+            select(Child.birth_date, ChildLatestDq.dq_id, ChildLatestDq.gross_motor_score,
+                   ChildLatestDq.fine_motor_score, ChildLatestDq.language_score,
+                   ChildLatestDq.adaptability_score, ChildLatestDq.social_score)
+            .outerjoin(ChildLatestDq, ChildLatestDq.child_id == Child.child_id)
+            .where(Child.child_id == child_id)
+        ).first()
         if not child:
             raise ValueError("Child not found")
 
         # 计算当前月龄（精确到1位小数）
-        birth_date = child.birth_date
-        today = date.today()
-        
-        # 计算年、月、日差值
-        years = today.year - birth_date.year
-        months = today.month - birth_date.month
-        days = today.day - birth_date.day
-        
-        # 处理日期不够减
-        if days < 0:
-            months -= 1
-            # 获取上个月的天数
-            last_month = today.month - 1 if today.month > 1 else 12
-            last_month_year = today.year if today.month > 1 else today.year - 1
-            last_month_days = (date(last_month_year, last_month + 1, 1) - date(last_month_year, last_month, 1)).days
-            days += last_month_days
-        
-        # 处理月份不够减
-        if months < 0:
-            years -= 1
-            months += 12
-        
-        # 总月龄 = 年×12 + 月 + 日/30（按30天折算为月）
-        total_months = years * 12 + months + days / 30.0
-        month_age = round(max(total_months, 0.1), 1)  # 最小0.1月龄，避免0或负数
-
-        if not Dq.query.filter_by(child_id=child_id).all():
+        month_age = exact_month_age(child.birth_date)
+
+        if child.dq_id is None:
             score = [0, 0, 0, 0, 0]
         else:
-            # 查询该学生最近一次测试（按日期降序排列取第一条）
-            latest_test = Dq.query.filter_by(child_id=child_id).order_by(Dq.date.desc()).first()
             score = [
-                latest_test.gross_motor_score,
-                latest_test.fine_motor_score,
-                latest_test.language_score,
-                latest_test.adaptability_score,
-                latest_test.social_score
+                child.gross_motor_score,
+                child.fine_motor_score,
+                child.language_score,
+                child.adaptability_score,
+                child.social_score
             ]
 
         return {
@@ -439,49 +374,19 @@ def test():
 
 
 @teacher.route("/getQuiz", methods=["GET"])
+@require_role(id_field="teacher_id")
 def getQuiz():
     try:
         # 请求参数
         project = request.args.get('project')
         month_age = int(request.args.get('month_age'))
         is_forward = int(request.args.get('is_forward'))
-        teacher_id = request.args.get('teacher_id')
-        uniquetoken = request.args.get('uniquetoken')
-        # --- 新增的Token验证逻辑 ---
-        user, user_role = verify_token_and_get_user(teacher_id, uniquetoken)
-        if not user:
-            return jsonify({
-                "code": 403,
-                "message": "Token mismatch, potential new device login.",
-                "data": None
-            })
-        # --- Token验证结束 ---
         # 更新月份
-        months = [1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12, 15, 18, 21, 24, 27, 30, 33, 36, 42, 48, 54, 60, 66, 72, 78, 84]
-        new_month_age = month_age
-        for index, month in enumerate(months):
-            if month_age == month:
-                if is_forward == 1:
-                    if month_age == 84:
-                        new_month_age = 84
-                    else:
-                        new_month_age = months[index + 1]
-                elif is_forward == -1:
-                    if month_age == 1:
-                        new_month_age = 1
-                    else:
-                        new_month_age = months[index - 1]
-                break
-            elif month < month_age < months[index + 1]:
-                new_month_age = month
-                break
+        new_month_age = step_band(month_age, is_forward)
 
         # 查询题目
         projectToNum = {'gross_motor': 1, 'fine_motor': 2, 'language': 3, 'adaptability': 4, 'social': 5}
-        quizzes = QuizInfo.query.filter_by(
-            month_age=new_month_age,
-            sort=projectToNum[project]
-        ).order_by(QuizInfo.quiz_id).all()  # 按 quiz_id 排序确保顺序一致
+        quizzes = quiz_catalog.get(new_month_age, projectToNum[project])  # 已按 quiz_id 排序
 
         # 构建返回数据
         result = [
@@ -522,17 +427,6 @@ def generate_report(base_info, dq_id, dqs, dq, grade):
     # 创建PDF文档
     doc = SimpleDocTemplate(f"pdf/report_{dq_id}.pdf", pagesize=A4)
     url = f"https://kindergarten-177863-9-1372785009.sh.run.tcloudbase.com/teacher/getPdf?dq_id={dq_id}"
-    teacher_id = request.args.get('teacher_id')
-    uniquetoken = request.args.get('uniquetoken')
-    # --- 新增的Token验证逻辑 ---
-    user, user_role = verify_token_and_get_user(teacher_id, uniquetoken)
-    if not user:
-        return jsonify({
-            "code": 403,
-            "message": "Token mismatch, potential new device login.",
-            "data": None
-        })
-    # --- Token验证结束 ---
     # 自定义样式
     styles = getSampleStyleSheet()
     styles.add(ParagraphStyle(
@@ -672,6 +566,7 @@ def generate_report(base_info, dq_id, dqs, dq, grade):
 
 
 @teacher.route("/recordScore", methods=["POST"])
+@require_role(id_field="teacher_id")
 def record():
     try:
         # 获取前端发送的JSON数据
@@ -681,16 +576,6 @@ def record():
         maxPass_month = data["maxPass_month"]
         answer_set = data["answer_set"]
 
-        uniquetoken = request.args.get('uniquetoken')
-        # --- 新增的Token验证逻辑 ---
-        user, user_role = verify_token_and_get_user(teacher_id, uniquetoken)
-        if not user:
-            return jsonify({
-                "code": 403,
-                "message": "Token mismatch, potential new device login.",
-                "data": None
-            })
-        # --- Token验证结束 ---
         # 获取该学生对象
         child = Child.query.get(child_id)
         if not child:
@@ -700,26 +585,9 @@ def record():
         if not t:
             raise ValueError("Teacher not found")
 
-        # 计算实际月龄
-        birth_date = child.birth_date
-        today = datetime.now()
-        child_month_age = (today.year - birth_date.year) * 12 + (today.month - birth_date.month)
-        if today.day < birth_date.day:
-            child_month_age -= 1
-        child_month_age = max(child_month_age, 1)  # 确保月龄 >= 1
-
-        # 计算主测月龄（找一个最接近但不大于实际月龄的月龄）
-        months = [1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12, 15, 18, 21, 24, 27, 30, 33, 36, 42, 48, 54, 60, 66, 72, 78, 84]
-        test_age = child_month_age
-        if child_month_age >= months[-1]:
-            test_age = months[-1]
-        else:
-            for index, month in enumerate(months):
-                if child_month_age == month:
-                    break
-                elif month < child_month_age < months[index + 1]:
-                    test_age = month
-                    break
+        # 计算实际月龄，以及主测月龄（不大于实际月龄的最大档位）
+        child_month_age = whole_month_age(child.birth_date)
+        test_age = test_band(child_month_age)
 
         # 测评报告的基本信息
         base_info = {
@@ -772,7 +640,7 @@ def record():
             for answer in project:
                 is_pass = int(answer["is_pass"])
                 month = int(answer["month"])
-                index2 = months.index(month)
+                index2 = TEST_MONTHS.index(month)
                 if 1 <= month <= 12:
                     ratio = 1
                 elif 15 <= month <= 36:
@@ -821,6 +689,17 @@ def record():
                 is_pass = int(answer["is_pass"])
                 test_detail = TestDetail(dq_id=dq_id, quiz_id=quiz_id, is_pass=is_pass)
                 db.session.add(test_detail)
+
+        # 更新该学生最近一次测试的分数
+        db.session.merge(ChildLatestDq(
+            child_id=child_id,
+            dq_id=dq_id,
+            gross_motor_score=dqs[0],
+            fine_motor_score=dqs[1],
+            language_score=dqs[2],
+            adaptability_score=dqs[3],
+            social_score=dqs[4]
+        ))
         db.session.commit()
 
         # 生成测评报告, 并将url存入Dq表
@@ -847,26 +726,8 @@ def record():
 
 
 @teacher.route('/getPdf', methods=['GET'])
+@require_role(id_field="teacher_id")
 def getPdf():
-    try:
-        teacher_id = request.args.get('teacher_id')
-        uniquetoken = request.args.get('uniquetoken')
-        # --- 新增的Token验证逻辑 ---
-        user, user_role = verify_token_and_get_user(teacher_id, uniquetoken)
-        if not user:
-            return jsonify({
-                "code": 403,
-                "message": "Token mismatch, potential new device login.",
-                "data": None
-            })
-        # --- Token验证结束 ---
-    except Exception as e:
-        db.session.rollback()
-        return jsonify({
-            "code": 400,
-            "message": f"服务器错误: {str(e)}",
-            "data": None
-        })
     dq_id = request.args.get('dq_id')
 
     project_root = os.path.dirname(current_app.root_path)
@@ -883,17 +744,19 @@ def getPdf():
 
 
 @teacher.route("/getChildTestRecord", methods=["GET"])
+@read_replica
 def getChildTestRecord():
     try:
         child_id = request.args.get('child_id')
-        tests = Dq.query.filter_by(child_id=child_id).all()
-        testRecord = []
-        if tests:
-            testRecord = [{"dq_id": t.dq_id, "date": t.date, "dq": t.dq} for t in tests]
+        # 可选 limit/cursor 按测试时间分页
+        stmt = select(Dq.dq_id, Dq.date, Dq.dq).where(Dq.child_id == child_id)
+        tests, next_cursor = fetch_page(stmt, [Dq.date, Dq.dq_id])
+        testRecord = [{"dq_id": t.dq_id, "date": t.date, "dq": t.dq} for t in tests]
         return jsonify({
             "code": 200,
             "message": "success",
-            "data": testRecord
+            "data": testRecord,
+            "next_cursor": next_cursor
         })
     except Exception as e:
         db.session.rollback()
@@ -904,175 +767,153 @@ def getChildTestRecord():
         })
 
 
-@teacher.route("/getTestDetail", methods=["GET"])
-def getTestDetail():
-    try:
-        dq_id = request.args.get('dq_id')
-        teacher_id = request.args.get('teacher_id')
-        uniquetoken = request.args.get('uniquetoken')
-        # --- 新增的Token验证逻辑 ---
-        user, user_role = verify_token_and_get_user(teacher_id, uniquetoken)
-        if not user:
-            return jsonify({
-                "code": 403,
-                "message": "Token mismatch, potential new device login.",
-                "data": None
+# 已完成的测评不会再变化，组装好的详情按 dq_id 缓存在进程内（LRU）
+# 删除学生/班级/教师后缓存不会失效，命中时由 check_test_detail 确认测评、学生、教师仍然存在
+TEST_DETAIL_CACHE_SIZE = 512
+test_detail_cache = MemoryBackend(TEST_DETAIL_CACHE_SIZE)
+
+# 五个能区，顺序与 QuizInfo.sort（从1开始）一致
+PROJECTS = (
+    ("gross_motor", "gross_motor_score"),
+    ("fine_motor", "fine_motor_score"),
+    ("language", "language_score"),
+    ("adaptability", "adaptability_score"),
+    ("social", "social_score"),
+)
+
+
+def _check_test_detail_row(row):
+    """与 load_test_detail 相同的错误：测评、学生、教师任一不存在时抛出 ValueError"""
+    if row is None:
+        raise ValueError("Dq not found")
+    if row.child_id is None:
+        raise ValueError("Child not found")
+    if row.teacher_name is None:
+        raise ValueError("Teacher not found")
+
+
+def check_test_detail(dq_id):
+    """缓存命中时调用：按主键确认测评及其学生、教师仍然存在"""
+    row = db.session.execute(
+        select(Child.child_id, Teacher.teacher_name)
+        .select_from(Dq)
+        .outerjoin(Child, Child.child_id == Dq.child_id)
+        .outerjoin(Teacher, Teacher.teacher_id == Dq.teacher_id)
+        .where(Dq.dq_id == dq_id)
+    ).first()
+    _check_test_detail_row(row)
+
+
+def load_test_detail(dq_id):
+    """
+    一次联表查询取出 Dq、学生、老师和全部答题记录，组装成与当前日期无关的测评详情
+    :return: dict，测评不存在时抛出 ValueError
+    """
+    rows = db.session.execute(
+        select(Dq.dq_id, Dq.gross_motor_score, Dq.fine_motor_score, Dq.language_score, Dq.adaptability_score,
+               Dq.social_score, Dq.dq, Dq.pdf_path, Child.child_id, Child.child_name, Child.gender,
+               Child.birth_date, Teacher.teacher_name, QuizInfo.quiz_id, QuizInfo.quiz_name,
+               QuizInfo.quiz_method, QuizInfo.pass_need, QuizInfo.sort, TestDetail.is_pass)
+        .outerjoin(Child, Child.child_id == Dq.child_id)
+        .outerjoin(Teacher, Teacher.teacher_id == Dq.teacher_id)
+        .outerjoin(TestDetail, TestDetail.dq_id == Dq.dq_id)
+        .outerjoin(QuizInfo, QuizInfo.quiz_id == TestDetail.quiz_id)
+        .where(Dq.dq_id == dq_id)
+        .order_by(QuizInfo.sort, QuizInfo.quiz_id)
+    ).all()
+    first = rows[0] if rows else None
+    _check_test_detail_row(first)
+
+    quiz_lists = {sort: [] for sort in range(1, len(PROJECTS) + 1)}
+    for row in rows:
+        if row.quiz_id is not None and row.sort in quiz_lists:
+            quiz_lists[row.sort].append({
+                "quiz_id": row.quiz_id,
+                "quiz_name": row.quiz_name,
+                "quiz_method": row.quiz_method,
+                "pass_need": row.pass_need,
+                "is_pass": row.is_pass
             })
-        # --- Token验证结束 ---
-        dq = Dq.query.get(dq_id)
-        if not dq:
-            raise ValueError("Dq not found")
 
-        # 重复代码
-        teacher_id = dq.teacher_id
-        child_id = dq.child_id
+    # 智龄
+    dqs = [getattr(first, score_field) for _, score_field in PROJECTS]
+
+    # 发育等级
+    grade = "智力发育障碍"
+    if first.dq > 130:
+        grade = "优秀"
+    elif first.dq >= 110:
+        grade = "良好"
+    elif first.dq >= 80:
+        grade = "中等"
+    elif first.dq >= 70:
+        grade = "临界偏低"
+
+    return {
+        "child_name": first.child_name,
+        "child_gender": first.gender,
+        "birth_date": first.birth_date,
+        "teacher_name": first.teacher_name,
+        "dqs": dqs,
+        "dq": first.dq,
+        "intelligence_age": dqs + [round(sum(dqs) / 5, 1)],
+        "grade": grade,
+        "pdf_url": first.pdf_path,
+        "detail": [
+            {"project": project, "score": dqs[index], "quiz_list": quiz_lists[index + 1]}
+            for index, (project, _) in enumerate(PROJECTS)
+        ],
+    }
 
-        # 获取该学生对象
-        child = Child.query.get(child_id)
-        if not child:
-            raise ValueError("Child not found")
-        # 获取老师对象
-        t = Teacher.query.get(teacher_id)
-        if not teacher:
-            raise ValueError("Child not found")
 
-        # 计算当前月龄（精确到1位小数）
-        birth_date = child.birth_date
-        today = date.today()
-        
-        # 计算年、月、日差值
-        years = today.year - birth_date.year
-        months = today.month - birth_date.month
-        days = today.day - birth_date.day
-        
-        # 处理日期不够减
-        if days < 0:
-            months -= 1
-            # 获取上个月的天数
-            last_month = today.month - 1 if today.month > 1 else 12
-            last_month_year = today.year if today.month > 1 else today.year - 1
-            last_month_days = (date(last_month_year, last_month + 1, 1) - date(last_month_year, last_month, 1)).days
-            days += last_month_days
-        
-        # 处理月份不够减
-        if months < 0:
-            years -= 1
-            months += 12
-        
-        # 总月龄 = 年×12 + 月 + 日/30（按30天折算为月）
-        total_months = years * 12 + months + days / 30.0
-        child_month_age = round(max(total_months, 0.1), 1)  # 最小0.1月龄，避免0或负数
-
-        # 计算主测月龄（找一个最接近但不大于实际月龄的月龄）
-        months = [1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12, 15, 18, 21, 24, 27, 30, 33, 36, 42, 48, 54, 60, 66, 72, 78, 84]
-        test_age = child_month_age
-        if child_month_age > months[-1]:
-            test_age = months[-1]
+@teacher.route("/getTestDetail", methods=["GET"])
+@require_role(id_field="teacher_id")
+@read_replica
+def getTestDetail():
+    try:
+        dq_id = int(request.args.get('dq_id'))
+        detail = test_detail_cache.get(dq_id)
+        if detail is None:
+            detail = load_test_detail(dq_id)
+            if detail["pdf_url"]:  # 报告生成完成后内容不再变化
+                test_detail_cache.set(dq_id, detail, ttl=24 * 3600)
         else:
-            for index, month in enumerate(months):
-                if child_month_age == month:
-                    break
-                elif month < child_month_age < months[index + 1]:
-                    test_age = month
-                    break
+            check_test_detail(dq_id)
+
+        # 以下与当前日期有关，每次请求重新计算
+        # 计算当前月龄（精确到1位小数）和主测月龄
+        child_month_age = exact_month_age(detail["birth_date"])
+        test_age = test_band(child_month_age)
 
         # 测评报告的基本信息
         base_info = {
-            "child_name": child.child_name,
-            "child_gender": child.gender,
-            "birth_date": child.birth_date.strftime("%Y-%m-%d"),
+            "child_name": detail["child_name"],
+            "child_gender": detail["child_gender"],
+            "birth_date": detail["birth_date"].strftime("%Y-%m-%d"),
             "test_date": datetime.now().strftime("%Y-%m-%d"),
             "month_age": child_month_age,
             "test_age": test_age,
             "test_tool": "《0～6岁儿童发育行为评估量表（WS/T 580—2017）》",
-            "teacher_name": t.teacher_name,
+            "teacher_name": detail["teacher_name"],
         }
 
-        # 智龄
-        dqs = [dq.gross_motor_score, dq.fine_motor_score, dq.language_score, dq.adaptability_score,
-               dq.social_score]
-        intelligence_age = [dqs[0], dqs[1], dqs[2], dqs[3], dqs[4], round(sum(dqs) / 5, 1)]
-
         # 发育商
-        dq2 = [round(item / child_month_age * 100, 1) for item in dqs]
-        dq2.append(dq.dq)
-
-        # 发育等级
-        grade = "智力发育障碍"
-        if dq.dq > 130:
-            grade = "优秀"
-        elif dq.dq >= 110:
-            grade = "良好"
-        elif dq.dq >= 80:
-            grade = "中等"
-        elif dq.dq >= 70:
-            grade = "临界偏低"
-
-        projects = [
-            {
-                "project": "gross_motor",
-                "score_field": "gross_motor_score"
-            },
-            {
-                "project": "fine_motor",
-                "score_field": "fine_motor_score"
-            },
-            {
-                "project": "language",
-                "score_field": "language_score"
-            },
-            {
-                "project": "adaptability",
-                "score_field": "adaptability_score"
-            },
-            {
-                "project": "social",
-                "score_field": "social_score"
-            }
-        ]
-
-        result = []
-
-        for project in projects:
-            quiz_items = (
-                db.session.query(QuizInfo, TestDetail.is_pass)
-                .join(TestDetail, QuizInfo.quiz_id == TestDetail.quiz_id)
-                .filter(
-                    TestDetail.dq_id == dq_id,
-                    QuizInfo.sort == projects.index(project) + 1  # sort starts at 1
-                )
-                .all()
-            )
+        dq2 = [round(item / child_month_age * 100, 1) for item in detail["dqs"]]
+        dq2.append(detail["dq"])
 
-            quiz_list = []
-            for quiz_info, is_pass in quiz_items:
-                quiz_list.append({
-                    "quiz_id": quiz_info.quiz_id,
-                    "quiz_name": quiz_info.quiz_name,
-                    "quiz_method": quiz_info.quiz_method,
-                    "pass_need": quiz_info.pass_need,
-                    "is_pass": is_pass
-                })
-
-            # Add to result
-            result.append({
-                "project": project["project"],
-                "score": getattr(dq, project["score_field"]),
-                "quiz_list": quiz_list
-            })
         return jsonify({
             "code": 200,
             "message": "success",
             "data": {
                 "baseInfo": base_info,
                 "score": {
-                    "intelligence_age": intelligence_age,
+                    "intelligence_age": detail["intelligence_age"],
                     "full": [child_month_age] * 5,
                     "dq": dq2,
-                    "grade": grade,
-                    "pdf_url": dq.pdf_path
+                    "grade": detail["grade"],
+                    "pdf_url": detail["pdf_url"]
                 },
-                "detail": result
+                "detail": detail["detail"]
             }
         })
 
@@ -1081,77 +922,49 @@ def getTestDetail():
 
 
 @teacher.route("/recommendGame", methods=["GET"])
+@require_role(id_field="teacher_id")
 def recommendGame():
     try:
-        teacher_id = request.args.get('teacher_id')
-        uniquetoken = request.args.get('uniquetoken')
-        # --- 新增的Token验证逻辑 ---
-        user, user_role = verify_token_and_get_user(teacher_id, uniquetoken)
-        if not user:
-            return jsonify({
-                "code": 403,
-                "message": "Token mismatch, potential new device login.",
-                "data": None
-            })
-        # --- Token验证结束 ---
         game_sort = int(request.args.get('sort'))
         month_age = int(request.args.get('month_age'))
 
         if game_sort not in (1, 2, 3, 4, 5):
             return jsonify({'code': 400, 'message': 'Invalid game sort value. Must be between 1 and 5.'})
 
-        games = Game.query.filter(
-            Game.game_sort == game_sort,
-            Game.game_beginTime <= month_age,
-            Game.game_endTime >= month_age
-        ).all()
-
-        game_list = [{
-            'game_name': game.game_name,
-            'game_sort': game.game_sort,
-            'game_beginTime': game.game_beginTime,
-            'game_endTime': game.game_endTime,
-            'game_bg': game.game_bg,
-            'game_prepare': game.game_prepare,
-            'game_purpose': game.game_purpose,
-            'game_process': game.game_process,
-            'cautions': game.cautions
-        } for game in games]
-
-        return jsonify({'code': 200, 'message': 'success', 'data': game_list})
+        # 返回的字段：fields=game_id,game_name,... 或 view=summary，默认为全部字段
+        fields = GameRecord.FIELDS
+        if request.args.get('fields'):
+            requested = set(request.args.get('fields').split(','))
+            unknown = requested.difference(GameRecord.__slots__)
+            if unknown:
+                return jsonify({"code": 400, "message": f"未知字段: {','.join(sorted(unknown))}", "data": []})
+            fields = tuple(name for name in GameRecord.__slots__ if name in requested)
+        elif request.args.get('view') == 'summary':
+            fields = GameRecord.SUMMARY_FIELDS
+
+        # 响应体已按 (sort, month_age) 预先序列化
+        return current_app.response_class(game_catalog.response_body(game_sort, month_age, fields),
+                                          mimetype="application/json")
 
     except Exception as e:
         return jsonify({"code": 400, "message": f"错误: {str(e)}", "data": []})
 
 
+@teacher.route("/game/<int:game_id>", methods=["GET"])
+@require_role(id_field="teacher_id")
+def getGame(game_id):
+    """
+    单个游戏的全部信息，列表使用 view=summary 时由前端在打开游戏时再获取
+    """
+    game = game_catalog.get_by_id(game_id)
+    if game is None:
+        return jsonify({"code": 400, "message": "游戏不存在", "data": None})
+    return jsonify({"code": 200, "message": "success", "data": game.to_dict(GameRecord.__slots__)})
+
+
 @teacher.route("/addAdmin", methods=["GET"])
+@require_role("admin", id_field="teacher_id", unauthorized=ADMIN_DENIED, forbidden=ADMIN_DENIED)
 def addAdmin():
-    try:
-        # 从URL查询参数中获取操作者的ID和token
-        teacher_id = request.args.get('teacher_id')
-        uniquetoken = request.args.get('uniquetoken')
-
-        # 检查必要参数是否存在
-        if not all([teacher_id, uniquetoken]):
-            return jsonify({"code": 400, "message": "缺少必要参数: teacher_id 和 uniquetoken"})
-
-        # --- Token验证逻辑 ---
-        # 调用验证函数，验证操作者身份和token
-        user, role = verify_token_and_get_user(teacher_id, uniquetoken)
-
-        # 验证失败或权限不足（必须是 'admin' 角色）
-        if not user or role != 'admin':
-            return jsonify({
-                "code": 403,
-                "message": "Token无效或权限不足",
-                "data": None
-            })
-        # --- Token验证结束 ---
-
-        # 验证通过，继续执行原始的数据插入逻辑
-    except Exception as e:
-        db.session.rollback()
-        print(f"插入数据时出错: {e}")
     """创建指定数量的伪造教师数据"""
     admin_data = [
         ('admin123', '13800000000')
@@ -1166,6 +979,7 @@ def addAdmin():
     db.session.add_all(admins)
     try:
         db.session.commit()
+        identity_index.clear()  # 新账号在下次登录时重新预热索引
         print(f"成功插入 {len(admins)} 条管理员数据")
     except Exception as e:
         db.session.rollback()
@@ -1173,27 +987,8 @@ def addAdmin():
 
 
 @teacher.route("/addTeacher", methods=["GET"])
+@require_role("admin", id_field="teacher_id", unauthorized=ADMIN_DENIED, forbidden=ADMIN_DENIED)
 def addTeacher():
-    # 从URL查询参数中获取操作者的ID和token
-    teacher_id = request.args.get('teacher_id')
-    uniquetoken = request.args.get('uniquetoken')
-
-    # 检查必要参数是否存在
-    if not all([teacher_id, uniquetoken]):
-        return jsonify({"code": 400, "message": "缺少必要参数: teacher_id 和 uniquetoken"})
-
-    # --- Token验证逻辑 ---
-    # 调用验证函数，验证操作者身份和token
-    user, role = verify_token_and_get_user(teacher_id, uniquetoken)
-
-    # 验证失败或权限不足（必须是 'admin' 角色）
-    if not user or role != 'admin':
-        return jsonify({
-            "code": 403,
-            "message": "Token无效或权限不足",
-            "data": None
-        })
-    # --- Token验证结束 ---
     """创建指定数量的伪造教师数据"""
     teacher_data = [
         ('刘园长', '13900000000', 'teacher123', '园长'),
@@ -1219,6 +1014,8 @@ def addTeacher():
     db.session.add_all(teachers)
     try:
         db.session.commit()
+        identity_index.clear()  # 新账号在下次登录时重新预热索引
+        bump_version("teacher")
         print(f"成功插入 {len(teachers)} 条教师数据")
     except Exception as e:
         db.session.rollback()
@@ -1226,27 +1023,8 @@ def addTeacher():
 
 
 @teacher.route("/addTeacherClass", methods=["GET"])
+@require_role("admin", id_field="teacher_id", unauthorized=ADMIN_DENIED, forbidden=ADMIN_DENIED)
 def addTeacherClass():
-    # 从URL查询参数中获取操作者的ID和token
-    teacher_id = request.args.get('teacher_id')
-    uniquetoken = request.args.get('uniquetoken')
-
-    # 检查必要参数是否存在
-    if not all([teacher_id, uniquetoken]):
-        return jsonify({"code": 400, "message": "缺少必要参数: teacher_id 和 uniquetoken"})
-
-    # --- Token验证逻辑 ---
-    # 调用验证函数，验证操作者身份和token
-    user, role = verify_token_and_get_user(teacher_id, uniquetoken)
-
-    # 验证失败或权限不足（必须是 'admin' 角色）
-    if not user or role != 'admin':
-        return jsonify({
-            "code": 403,
-            "message": "Token无效或权限不足",
-            "data": None
-        })
-    # --- Token验证结束 ---
     """创建指定数量的伪造教师-班级数据"""
     teacher_class_data = [
         (1, 2, 1),
@@ -1269,6 +1047,9 @@ def addTeacherClass():
     db.session.add_all(teacher_class)
     try:
         db.session.commit()
+        invalidate_teacher_classes()
+        invalidate_roster()
+        bump_version("teacher_class")
         print(f"成功插入 {len(teacher_class)} 条教师-班级数据")
     except Exception as e:
         db.session.rollback()
@@ -1276,27 +1057,8 @@ def addTeacherClass():
 
 
 @teacher.route("/addParent", methods=["GET"])
+@require_role("admin", id_field="teacher_id", unauthorized=ADMIN_DENIED, forbidden=ADMIN_DENIED)
 def addParent():
-    # 从URL查询参数中获取操作者的ID和token
-    teacher_id = request.args.get('teacher_id')
-    uniquetoken = request.args.get('uniquetoken')
-
-    # 检查必要参数是否存在
-    if not all([teacher_id, uniquetoken]):
-        return jsonify({"code": 400, "message": "缺少必要参数: teacher_id 和 uniquetoken"})
-
-    # --- Token验证逻辑 ---
-    # 调用验证函数，验证操作者身份和token
-    user, role = verify_token_and_get_user(teacher_id, uniquetoken)
-
-    # 验证失败或权限不足（必须是 'admin' 角色）
-    if not user or role != 'admin':
-        return jsonify({
-            "code": 403,
-            "message": "Token无效或权限不足",
-            "data": None
-        })
-    # --- Token验证结束 ---
     """创建指定数量的伪造家长数据"""
     parent_data = [
         ('13800000001', 'parent123'),
@@ -1342,6 +1104,7 @@ def addParent():
     db.session.add_all(parents)
     try:
         db.session.commit()
+        identity_index.clear()  # 新账号在下次登录时重新预热索引
         print(f"成功插入 {len(parents)} 条家长数据")
     except Exception as e:
         db.session.rollback()
@@ -1349,27 +1112,8 @@ def addParent():
 
 
 @teacher.route("/addChild", methods=["GET"])
+@require_role("admin", id_field="teacher_id", unauthorized=ADMIN_DENIED, forbidden=ADMIN_DENIED)
 def addChild():
-    # 从URL查询参数中获取操作者的ID和token
-    teacher_id = request.args.get('teacher_id')
-    uniquetoken = request.args.get('uniquetoken')
-
-    # 检查必要参数是否存在
-    if not all([teacher_id, uniquetoken]):
-        return jsonify({"code": 400, "message": "缺少必要参数: teacher_id 和 uniquetoken"})
-
-    # --- Token验证逻辑 ---
-    # 调用验证函数，验证操作者身份和token
-    user, role = verify_token_and_get_user(teacher_id, uniquetoken)
-
-    # 验证失败或权限不足（必须是 'admin' 角色）
-    if not user or role != 'admin':
-        return jsonify({
-            "code": 403,
-            "message": "Token无效或权限不足",
-            "data": None
-        })
-    # --- Token验证结束 ---
     """创建指定数量的伪造学生数据"""
     child_data = [
         # 小一班学生 (1-10)
@@ -1428,6 +1172,8 @@ def addChild():
     db.session.add_all(children)
     try:
         db.session.commit()
+        invalidate_roster()
+        bump_version("child")
         print(f"成功插入 {len(children)} 条学生数据")
     except Exception as e:
         db.session.rollback()
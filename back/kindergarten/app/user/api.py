@@ -1,9 +1,14 @@
 import jwt
 from datetime import datetime, timedelta, timezone
-from flask import request, jsonify, current_app
+from flask import request, jsonify, current_app, g
 from . import user
-from ..models import db, Parent, Teacher, Admin, Child, TeacherClass, Class
-from ..auth import verify_token_and_get_user
+from ..models import db, Teacher, Admin, Child, Class, ChildLatestDq
+from ..password import password_hasher, PasswordPoolBusy
+from ..ratelimit import login_limiter
+from ..auth import (require_role, decode_token, remember_token, token_cache,
+                    identity_index, login_candidates, teacher_class_ids, invalidate_teacher_classes)
+from ..versions import bump_version
+from ..roster import invalidate_roster
 
 def generate_token(user_id, role):
     """
@@ -18,6 +23,36 @@ def generate_token(user_id, role):
     return token
 
 
+def build_user_info(user_obj, role):
+    """
+    登录成功后返回给前端的用户信息
+    """
+    if role == "parent":
+        # 查找该家长的孩子信息
+        children = Child.query.filter(Child.guardian_id == user_obj.guardian_id).all()
+        return {
+            "user_id": user_obj.guardian_id,
+            "username": user_obj.phone,
+            "role": "parent",
+            "child": [{"child_id": c.child_id, "child_name": c.child_name} for c in children],
+            "token": generate_token(user_obj.guardian_id, "parent")
+        }
+    if role == "teacher":
+        return {
+            "user_id": user_obj.teacher_id,
+            "username": user_obj.teacher_name,
+            "role": "teacher",
+            "teacher_role": user_obj.role,
+            "token": generate_token(user_obj.teacher_id, "teacher")
+        }
+    return {
+        "user_id": user_obj.admin_id,
+        "username": "管理员",
+        "role": "admin",
+        "token": generate_token(user_obj.admin_id, "admin")
+    }
+
+
 @user.route("/login", methods=["POST"])
 def login():
     """
@@ -39,75 +74,43 @@ def login():
         # username = request.args.get('username')
         # password = request.args.get('password')
 
-        # 尝试在不同用户表中查找用户
+        # 失败次数过多的手机号/IP直接拒绝，不做任何密码哈希计算
+        # 客户端IP取连接的对端地址；部署在反向代理之后时由 ProxyFix（PROXY_FIX_X_FOR）按可信代理层数改写，
+        # 不直接读 X-Forwarded-For，否则客户端每次换一个伪造的值就能绕过按IP限流
+        client_ip = request.remote_addr
+        if not login_limiter.allow(username, client_ip):
+            return jsonify({
+                "code": 429,
+                "message": "登录失败次数过多，请稍后重试",
+                "data": None
+            }), 429
+
+        # 通过身份索引定位账号（家长/教师/管理员），每个候选账号只需一次主键查询
         user_info = None
         user_obj = None  # 用于存储找到的用户对象
         role = None  # 用于存储角色
 
-        # 1. 家长（使用手机号作为用户名）
-        parent = Parent.query.filter(Parent.phone == username).first()
-
-        if parent and parent.check_password(password):
-            # 查找该家长的孩子信息
-            user_obj = parent
-            role = "parent"
-            child = Child.query.filter(
-                (Child.guardian1_id == parent.guardian_id) |
-                (Child.guardian2_id == parent.guardian_id)
-            ).all()
-
-            child2 = [{"child_id": c.child_id, "child_name": c.child_name} for c in child]
-
-            user_info = {
-                "user_id": parent.guardian_id,
-                "username": parent.guardian_name,
-                "role": "parent",
-                "child": child2,
-                "token": generate_token(parent.guardian_id, "parent")
-            }
+        for account_role, account in login_candidates(username):
+            if account.check_password(password):
+                user_obj = account
+                role = account_role
+                user_info = build_user_info(account, account_role)
+                break
 
-        # 2. 教师
-        if not user_info:
-            print(1)
-            t = Teacher.query.filter_by(phone=username).first()
-            if t:
-                print(f"教师ID: {t.teacher_id}")
-            else:
-                print("该用户不是教师，准备尝试管理员登录")
-
-            if t and t.check_password(password):
-                user_obj = t
-                role = "teacher"
-                user_info = {
-                    "user_id": t.teacher_id,
-                    "username": t.teacher_name,
-                    "role": "teacher",
-                    "teacher_role": t.role,
-                    "token": generate_token(t.teacher_id, "teacher")
-                }
-
-        # 3. 管理员
-        if not user_info:
-            admin = Admin.query.filter(Admin.phone == username).first()
-
-            if admin and admin.check_password(password):
-                user_obj = admin
-                role = "admin"
-                user_info = {
-                    "user_id": admin.admin_id,
-                    "username": "管理员",
-                    "role": "admin",
-                    "token": generate_token(admin.admin_id, "admin")
-                }
-
-                # 如果用户验证成功
+        # 如果用户验证成功
         if user_info and user_obj and role:
+            # 哈希参数调整后，用本次登录的明文密码透明地重新计算哈希
+            if password_hasher.needs_rehash(user_obj.pwd):
+                user_obj.set_password(password)
             old_token_from_db = user_obj.token
             new_token = generate_token(user_info['user_id'], role)
             user_info["uniquetoken"] = new_token
             # 写入数据库
             user_obj.token = new_token
             db.session.commit()
+            # 旧token立即失效，保证新设备登录后旧设备被踢下线；新token直接进缓存
+            remember_token(user_obj, role, new_token)
+            login_limiter.reset(username)
 
             code = 200
             message = "success" if old_token_from_db == new_token else "Token mismatch, potential new device login."
@@ -118,13 +121,20 @@ def login():
                         "data": user_info
                     })
 
-                    # 用户名或密码错误
+        # 用户名或密码错误
+        login_limiter.record_failure(username, client_ip)
         return jsonify({
                     "code": 400,
                     "message": "用户名或密码错误",
                     "data": None
                 })
 
+    except PasswordPoolBusy:
+        return jsonify({
+            "code": 503,
+            "message": "登录人数过多，请稍后重试",
+            "data": None
+        }), 503
     except Exception as e:
         return jsonify({
             "code": 400,
@@ -137,13 +147,7 @@ def verify_token(token):
     """
     验证JWT token
     """
-    try:
-        payload = jwt.decode(token, current_app.config['SECRET_KEY'], algorithms=['HS256'])
-        return payload
-    except jwt.ExpiredSignatureError:
-        return None
-    except jwt.InvalidTokenError:
-        return None
+    return decode_token(token)
 
 @user.route("/getAllClasses", methods=["GET"])
 def getAllClasses():
@@ -169,7 +173,8 @@ def getAllClasses():
         class_list = [
             {
                 "class_id": class_info.class_id,
-                "class_name": class_info.class_name
+                "class_name": class_info.class_name,
+                "student_count": class_info.student_count
             }
             for class_info in all_classes
         ]
@@ -188,6 +193,7 @@ def getAllClasses():
         })
 
 @user.route("/registerChild", methods=["POST"])
+@require_role("admin", "园长", "管理级教师")
 def registerChild():
     try:
         # 获取请求数据
@@ -195,46 +201,13 @@ def registerChild():
         if not data:
             return jsonify({"code": 400, "message": "请求数据格式错误", "data": None})
 
-        # 检查角色
-        is_manager = 1   # 是否为园长
-        manager_id = int(data.get("manager_id"))
-        uniquetoken = request.args.get('uniquetoken')  # 新增：获取uniquetoken
-
-        # --- 新增的Token验证逻辑 ---
-        user, role = verify_token_and_get_user(manager_id, uniquetoken)
-        if not user:
-            return jsonify({
-                "code": 403,
-                "message": "Token mismatch, potential new device login.",
-                "data": None
-            })
-        # --- Token验证结束 ---
-
-        # 检查是否为管理员
-        manager_admin = Admin.query.get(manager_id)
-        if manager_admin:
-            pass
-        else:
-            manager = Teacher.query.get(manager_id)
-            if not manager or manager.role != "园长":
-                if manager.role != "管理级教师":
-                    return jsonify({"code": 400, "message": "没有操作权限", "data": []})
-                else:
-                    is_manager = 0
+        # 检查角色：管理员和园长可以注册到任意班级
+        is_manager = g.permissions & {"admin", "园长"}
 
         # 如果是管理级教师，则必须满足学生注册为自己管理的班级
-        if not manager_admin and is_manager == 0:
-            # 查询Teacher_Class表中该teacher_id对应的所有记录
-            teacher_classes = TeacherClass.query.filter_by(teacher_id=manager_id).all()
-            # 获取所有关联班级的详细信息
-            class_list = []
-            for tc in teacher_classes:
-                class_list.append(tc.class_id)
-
-            # 加入体验班，因为每个老师都能测试体验班(class_id=1)
-            class_list.append(1)
-
-            if int(data['class_id']) not in class_list:
+        # 可操作班级集合已包含体验班，因为每个老师都能测试体验班(class_id=1)
+        if not is_manager:
+            if int(data['class_id']) not in teacher_class_ids(g.user_id):
                 return jsonify({"code": 400, "message": "该学生必须加入该老师所管理的班级！", "data": []})
 
         # 是否为体验班
@@ -257,6 +230,8 @@ def registerChild():
         db.session.flush()  # 获取新插入记录的ID
 
         db.session.commit()
+        invalidate_roster(new_child.class_id)
+        bump_version("child")
 
         return jsonify({
             "code": 200,
@@ -276,6 +251,7 @@ def registerChild():
 
 
 @user.route("/deleteChild", methods=["POST"])
+@require_role("admin", "园长", "管理级教师")
 def deleteChild():
     try:
         # 获取请求数据
@@ -287,37 +263,20 @@ def deleteChild():
         if 'manager_id' not in data or 'child_id' not in data:
             return jsonify({"code": 400, "message": "缺少必要参数", "data": None})
 
-        uniquetoken = data['uniquetoken']
-        manager_id = data['manager_id']
         child_id = data['child_id']
 
-        # --- 新增的Token验证逻辑 ---
-        user, role = verify_token_and_get_user(manager_id, uniquetoken)
-        if not user:
-            return jsonify({
-                "code": 403,
-                "message": "Token mismatch, potential new device login.",
-                "data": None
-            })
-        # --- Token验证结束 ---
-
-
-        # 新增：检查是否为管理员
-        manager_admin = Admin.query.get(manager_id)
-        if not manager_admin:
-            # 检查操作者是否为园长
-            manager = Teacher.query.filter_by(teacher_id=manager_id).first()
-            if not manager or manager.role not in ["园长", "管理级教师"]:
-                return jsonify({"code": 400, "message": "没有操作权限", "data": None})
-
         # 查找要删除的孩子
         child = Child.query.filter_by(child_id=child_id).first()
         if not child:
             return jsonify({"code": 400, "message": "未找到该孩子信息", "data": None})
 
         # 执行删除操作
+        class_id = child.class_id
+        ChildLatestDq.query.filter_by(child_id=child.child_id).delete()
         db.session.delete(child)
         db.session.commit()
+        invalidate_roster(class_id)
+        bump_version("child")
 
         return jsonify({"code": 200, "message": "删除成功", "data": []})
 
@@ -331,6 +290,7 @@ def deleteChild():
 
 
 @user.route("/registerTeacher", methods=["POST"])
+@require_role("admin", "园长")
 def registerTeacher():
     # 获取请求数据
     data = request.get_json()
@@ -338,36 +298,11 @@ def registerTeacher():
     phone = data.get("phone")
     pwd = data.get("pwd")
     role = data.get("role", "")
-    manager_id = data.get("manager_id")
-    uniquetoken = data.get("uniquetoken")  # 新增：获取uniquetoken
 
     # 验证必要字段
     if not all([teacher_name, phone, pwd]):
         return jsonify({"code": 400, "message": "缺少必要参数", "data": None})
 
-        # --- 新增的Token验证逻辑 ---
-    user, user_role = verify_token_and_get_user(manager_id, uniquetoken)
-    if not user:
-        return jsonify({
-                "code": 403,
-                "message": "Token mismatch, potential new device login.",
-                "data": None
-            })
-        # --- Token验证结束 ---
-
-
-    # 检查园长权限，再检查管理员权限
-    manager_teacher = Teacher.query.get(manager_id)
-    manager_admin = Admin.query.get(manager_id)
-    has_permission = False
-    if manager_teacher and manager_teacher.role == "园长":
-        has_permission = True
-    elif manager_admin:
-        has_permission = True
-
-    if not has_permission:
-        return jsonify({"code": 400, "message": "没有操作权限", "data": []})
-
     # 检查手机号是否已存在
     if Teacher.query.filter_by(phone=phone).first():
         return jsonify({"code": 400, "message": "手机号已存在", "data": None})
@@ -384,6 +319,8 @@ def registerTeacher():
 
         db.session.add(new_teacher)
         db.session.commit()
+        identity_index.add(phone, "teacher", new_teacher.teacher_id)
+        bump_version("teacher")
 
         return jsonify({
             "code": 200,
@@ -397,6 +334,7 @@ def registerTeacher():
 
 
 @user.route("/deleteTeacher", methods=["POST"])
+@require_role("admin", "园长")
 def deleteTeacher():
     try:
         # 获取请求数据
@@ -408,30 +346,7 @@ def deleteTeacher():
         if 'manager_id' not in data or 'teacher_id' not in data:
             return jsonify({"code": 400, "message": "缺少必要参数", "data": None})
 
-        manager_id = data['manager_id']
         teacher_id = data['teacher_id']
-        uniquetoken = data.get('uniquetoken')  # 新增：获取uniquetoken
-
-        # --- 新增的Token验证逻辑 ---
-        user, user_role = verify_token_and_get_user(manager_id, uniquetoken)
-        if not user:
-            return jsonify({
-                "code": 403,
-                "message": "Token mismatch, potential new device login.",
-                "data": None
-            })
-        # --- Token验证结束 ---
-
-        # 检查园长权限，再检查管理员权限
-        manager_teacher = Teacher.query.get(manager_id)
-        manager_admin = Admin.query.get(manager_id)
-        has_permission = False
-        if manager_teacher and manager_teacher.role == "园长":
-            has_permission = True
-        elif manager_admin:
-            has_permission = True
-        if not has_permission:
-            return jsonify({"code": 400, "message": "没有操作权限", "data": []})
 
         # 查找要删除的老师
         t = Teacher.query.filter_by(teacher_id=teacher_id).first()
@@ -439,8 +354,14 @@ def deleteTeacher():
             return jsonify({"code": 400, "message": "未找到该老师信息", "data": None})
 
         # 执行删除操作
+        phone, deleted_id = t.phone, t.teacher_id
         db.session.delete(t)
         db.session.commit()
+        token_cache.invalidate_user(deleted_id)
+        invalidate_teacher_classes(deleted_id)
+        identity_index.remove(phone, "teacher", deleted_id)
+        invalidate_roster()
+        bump_version("teacher", "teacher_class")
 
         return jsonify({"code": 200, "message": "删除成功", "data": []})
 
@@ -0,0 +1,82 @@
+import hashlib
+import time
+from functools import wraps
+
+from flask import request, make_response, current_app, g
+
+from .cache import cache
+from .replica import replica_enabled, sticky_seconds
+
+# 版本号计数器的有效期，过期后重新生成一个新值（只会让客户端多拉取一次）
+TABLE_VERSION_TTL = 30 * 24 * 3600
+
+
+def _key(table):
+    return f"table_version:{table}"
+
+
+def table_version(table):
+    """表的当前版本号，存放在应用缓存中，多个worker共享"""
+    version = cache.get(_key(table))
+    if version is None:
+        version = time.time_ns()
+        cache.set(_key(table), version, ttl=TABLE_VERSION_TTL)
+    return version
+
+
+def bump_version(*tables):
+    """
+    数据修改提交后调用，使依赖这些表的 GET 接口的 ETag 失效
+    使用时间戳而不是自增，避免多个worker并发修改时读改写冲突
+    """
+    version = time.time_ns()
+    for table in tables:
+        cache.set(_key(table), version, ttl=TABLE_VERSION_TTL)
+    if replica_enabled():
+        # 只读副本在复制延迟时间内可能还是修改前的数据
+        for table in tables:
+            cache.set(f"table_modified:{table}", True, ttl=sticky_seconds())
+
+
+def compute_etag(tables):
+    """由 接口名 + 请求参数（不含token）+ 各表版本号 计算 ETag"""
+    args = sorted((k, v) for k, v in request.args.items(multi=True) if k != 'uniquetoken')
+    parts = [request.endpoint, repr(args)] + [f"{table}={table_version(table)}" for table in tables]
+    return hashlib.blake2b("|".join(parts).encode("utf-8"), digest_size=12).hexdigest()
+
+
+def replica_may_lag(tables):
+    """本次请求查询的是只读副本，且依赖的表在复制延迟时间内刚修改过：副本可能还没同步，响应不应带 ETag"""
+    if not g.get("db_replica", False):
+        return False
+    return any(cache.get(f"table_modified:{table}") for table in tables)
+
+
+def conditional(*tables):
+    """
+    GET 接口的条件请求装饰器，放在 require_role 之后：
+    If-None-Match 与当前 ETag 一致时直接返回 304，不查询数据库也不序列化
+    只有 code 为 200 的响应才带 ETag，错误响应不会被客户端缓存
+    缓存后端不共享（memory）时其他worker的修改不会更新本进程的版本号，不使用 ETag
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if not cache.shared:
+                return view(*args, **kwargs)
+            etag = compute_etag(tables)
+            # 压缩后的响应带弱 ETag，If-None-Match 按弱比较
+            if request.if_none_match.contains_weak(etag):
+                response = current_app.response_class(status=304)
+                response.set_etag(etag)
+                return response
+
+            g.pop("response_code", None)
+            response = make_response(view(*args, **kwargs))
+            # 业务状态码由 jsonify 记录在 g.response_code（见 jsonprovider）
+            if (response.status_code == 200 and g.get("response_code") == 200
+                    and not replica_may_lag(tables)):
+                response.set_etag(etag)
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,28 @@
+"""
+缓存后端对热点接口的影响：memory / sqlite 下预热后的每次请求耗时和SQL条数
+（sqlite 是多worker部署的默认后端；memory 不共享，token、ETag、花名册等依赖失效的缓存关闭，相当于直接查库）
+
+python bench/bench_cache.py
+"""
+from bench_utils import copy_database, create_bench_app, count_queries, timeit, login
+
+ROUNDS = 2000
+BACKENDS = ("memory", "sqlite")
+
+db_path = copy_database()
+print(f"{'后端':<8}{'接口':<10}{'SQL/次':>8}{'毫秒/次':>10}")
+for backend in BACKENDS:
+    app, _ = create_bench_app(db_path=db_path, CACHE_BACKEND=backend, PASSWORD_POOL_WORKERS=0)
+    client = app.test_client()
+    token = login(client, "13900000001", "teacher123")["data"]["uniquetoken"]
+    auth = f"teacher_id=2&uniquetoken={token}"
+    urls = {
+        "getClass": f"/teacher/getClass?{auth}",
+        "getQuiz": f"/teacher/getQuiz?project=language&month_age=12&is_forward=1&{auth}",
+    }
+    for name, url in urls.items():
+        client.get(url)  # 预热
+        with count_queries(app) as counter:
+            client.get(url)
+        elapsed, _ = timeit(lambda: client.get(url), ROUNDS)
+        print(f"{backend:<8}{name:<10}{counter['count']:>8}{elapsed / ROUNDS * 1000:>10.3f}")
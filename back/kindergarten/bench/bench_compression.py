@@ -0,0 +1,38 @@
+"""
+各接口响应的压缩率和压缩耗时（gzip，安装 brotli 后同时测 br），以及命中压缩缓存后的耗时
+
+python bench/bench_compression.py
+"""
+from bench_utils import create_bench_app, timeit, login
+
+from app.compression import compressor, brotli
+
+ROUNDS = 200
+
+app, db_path = create_bench_app()
+client = app.test_client()
+
+teacher = login(client, "13900000001", "teacher123")["data"]["uniquetoken"]
+admin = login(client, "13800000000", "admin123")["data"]["uniquetoken"]
+ENDPOINTS = [
+    ("getTestDetail", f"/teacher/getTestDetail?dq_id=1&teacher_id=2&uniquetoken={teacher}"),
+    ("recommendGame", f"/teacher/recommendGame?sort=1&month_age=12&teacher_id=2&uniquetoken={teacher}"),
+    ("recommendGame summary", f"/teacher/recommendGame?sort=1&month_age=12&view=summary&teacher_id=2&uniquetoken={teacher}"),
+    ("getChildInfo", f"/admin/getChildInfo?manager_id=1&uniquetoken={admin}"),
+]
+encodings = ["gzip"] + (["br"] if brotli else [])
+if not brotli:
+    print("未安装 brotli，只测试 gzip")
+
+print(f"{'接口':<24}{'编码':<6}{'原始字节':>10}{'压缩后':>10}{'压缩率':>8}{'压缩ms':>9}{'请求ms':>9}{'缓存命中ms':>12}")
+for name, url in ENDPOINTS:
+    raw = client.get(url).get_data()
+    for encoding in encodings:
+        compressed = compressor.compress(raw, encoding)
+        cpu, _ = timeit(lambda: compressor.compress(raw, encoding), ROUNDS)
+        # 未压缩请求 vs 压缩请求（第二次起命中压缩缓存）
+        plain, _ = timeit(lambda: client.get(url, headers={"Accept-Encoding": "identity"}), ROUNDS)
+        client.get(url, headers={"Accept-Encoding": encoding})
+        cached, _ = timeit(lambda: client.get(url, headers={"Accept-Encoding": encoding}), ROUNDS)
+        print(f"{name:<24}{encoding:<6}{len(raw):>10}{len(compressed):>10}{len(raw) / len(compressed):>8.1f}"
+              f"{cpu / ROUNDS * 1000:>9.2f}{plain / ROUNDS * 1000:>9.2f}{cached / ROUNDS * 1000:>12.2f}")
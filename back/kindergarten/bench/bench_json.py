@@ -0,0 +1,41 @@
+"""
+JSON 序列化耗时对比：Flask 默认编码器 vs FastJSONProvider（orjson/msgspec/标准库）
+使用真实的 getTestDetail / recommendGame 响应体
+
+python bench/bench_json.py
+"""
+from bench_utils import create_bench_app, timeit, login
+
+from flask.json.provider import DefaultJSONProvider
+from app.jsonprovider import FastJSONProvider, orjson, msgspec
+
+ROUNDS = 2000
+
+app, db_path = create_bench_app()
+client = app.test_client()
+
+token = login(client, "13900000001", "teacher123")["data"]["uniquetoken"]
+bodies = {}
+for dq_id in (1, 2):
+    bodies[f"getTestDetail dq_id={dq_id}"] = client.get(
+        f"/teacher/getTestDetail?dq_id={dq_id}&teacher_id=2&uniquetoken={token}").get_json()
+bodies["recommendGame sort=1 month_age=12"] = client.get(
+    f"/teacher/recommendGame?sort=1&month_age=12&teacher_id=2&uniquetoken={token}").get_json()
+
+default = DefaultJSONProvider(app)
+providers = [("Flask默认", default.dumps, {"separators": (",", ":")})]
+for encoder, module in (("stdlib", True), ("orjson", orjson), ("msgspec", msgspec)):
+    if not module:
+        print(f"未安装 {encoder}，跳过")
+        continue
+    provider = FastJSONProvider(app)
+    provider.configure(encoder)
+    providers.append((encoder, provider._encode, {}))
+
+for name, body in bodies.items():
+    print(f"\n{name}")
+    print(f"{'编码器':<10}{'字节数':>10}{'微秒/次':>10}")
+    for label, dumps, kwargs in providers:
+        size = len(dumps(body, **kwargs).encode("utf-8") if label == "Flask默认" else dumps(body))
+        elapsed, _ = timeit(lambda: dumps(body, **kwargs), ROUNDS)
+        print(f"{label:<10}{size:>10}{elapsed / ROUNDS * 1e6:>10.1f}")
@@ -0,0 +1,38 @@
+"""
+登录查找账号的吞吐量对比：身份索引 vs 依次查 Parent/Teacher/Admin 三张表
+
+python bench/bench_login.py
+"""
+from bench_utils import create_bench_app, count_queries, timeit, login
+
+from app.auth import find_accounts_by_phone, probe_accounts_by_phone, identity_index
+
+ROUNDS = 2000
+
+# (说明, 手机号, 密码)
+ACCOUNTS = [
+    ("家长", "13800000001", "parent123"),
+    ("教师", "13900000001", "teacher123"),
+    ("管理员", "13800000000", "admin123"),
+]
+
+app, db_path = create_bench_app()
+
+with app.app_context():
+    identity_index.warm()
+    print(f"{'账号':<6}{'方式':<8}{'SQL/次':>8}{'次/秒':>12}")
+    for name, phone, _ in ACCOUNTS:
+        for label, func in (("逐表查找", probe_accounts_by_phone), ("身份索引", find_accounts_by_phone)):
+            with count_queries(app) as counter:
+                func(phone)
+            _, rate = timeit(lambda: func(phone), ROUNDS)
+            print(f"{name:<6}{label:<8}{counter['count']:>8}{rate:>12.0f}")
+
+# 完整登录（包含密码哈希校验）
+client = app.test_client()
+print("\n完整登录")
+for name, phone, password in ACCOUNTS:
+    with count_queries(app) as counter:
+        result = login(client, phone, password)
+    _, rate = timeit(lambda: login(client, phone, password), 20)
+    print(f"{name:<6}code={result['code']} SQL/次={counter['count']} 次/秒={rate:.1f}")
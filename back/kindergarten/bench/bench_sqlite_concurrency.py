@@ -0,0 +1,133 @@
+"""
+SQLite 并发读写基准：多个进程（模拟 gunicorn worker）共用一个数据库副本，
+一部分请求读取测评记录，一部分请求按 recordScore 的方式写入测评结果，
+对比默认连接设置（develop）和 WAL 等 PRAGMA（sqlite）下的吞吐量和 "database is locked" 错误数
+按配置的 busy timeout 运行时锁冲突都在等待中消化（pysqlite 默认等待5秒），只体现为延迟；
+每种配置再以 busy timeout 为0运行一次，遇到锁立即报错，错误数即锁冲突的次数
+
+python bench/bench_sqlite_concurrency.py [进程数] [每种配置运行秒数]
+"""
+import multiprocessing
+import random
+import sys
+import time
+from datetime import datetime
+
+from sqlalchemy import select
+from sqlalchemy.exc import OperationalError
+
+from bench_utils import copy_database, create_bench_app
+import config
+from app import db
+from app.models import Child, Dq, TestDetail, ChildLatestDq
+
+WORKERS = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+DURATION = float(sys.argv[2]) if len(sys.argv) > 2 else 5
+# 写请求（提交一次测评）所占比例
+WRITE_RATIO = 0.2
+# 关闭应用缓存，读请求每次都查询数据库
+OVERRIDES = {"CACHE_BACKEND": "memory", "CACHE_MAX_SIZE": 0, "LOGIN_LIMIT_STORE": "memory",
+             "PASSWORD_POOL_WORKERS": 0, "MIGRATE_ON_START": True}
+
+
+def record_score(child_ids):
+    """与 recordScore 相同的事务：读学生 -> 写 Dq -> 写 TestDetail -> 更新 ChildLatestDq"""
+    child_id = random.choice(child_ids)
+    child = db.session.get(Child, child_id)
+    scores = [random.randint(60, 120) for _ in range(5)]
+    dq = Dq(teacher_id=2, child_id=child.child_id, month_age=12, gross_motor_score=scores[0],
+            fine_motor_score=scores[1], language_score=scores[2], adaptability_score=scores[3],
+            social_score=scores[4], dq=sum(scores) / 5, date=datetime.now())
+    db.session.add(dq)
+    db.session.flush()
+    db.session.add_all(TestDetail(dq_id=dq.dq_id, quiz_id=quiz_id, is_pass=1) for quiz_id in range(1, 6))
+    db.session.merge(ChildLatestDq(child_id=child_id, dq_id=dq.dq_id, gross_motor_score=scores[0],
+                                   fine_motor_score=scores[1], language_score=scores[2],
+                                   adaptability_score=scores[3], social_score=scores[4]))
+    db.session.commit()
+
+
+def no_wait_overrides(dev_name):
+    """busy timeout 为0的连接设置：pysqlite 的 timeout 参数和 PRAGMA busy_timeout 都设为0"""
+    base = config.config_map[dev_name]
+    options = dict(getattr(base, "SQLALCHEMY_ENGINE_OPTIONS", None) or {})
+    options["connect_args"] = dict(options.get("connect_args") or {}, timeout=0)
+    overrides = {"SQLALCHEMY_ENGINE_OPTIONS": options}
+    if "busy_timeout" in base.SQLITE_PRAGMAS:
+        overrides["SQLITE_PRAGMAS"] = dict(base.SQLITE_PRAGMAS, busy_timeout=0)
+    return overrides
+
+
+def worker(dev_name, db_path, start_at, results, overrides):
+    # 迁移已在主进程中执行
+    app, _ = create_bench_app(dev_name, db_path=db_path, **dict(OVERRIDES, MIGRATE_ON_START=False, **overrides))
+    client = app.test_client()
+    with app.app_context():
+        child_ids = db.session.execute(select(Child.child_id)).scalars().all()
+        db.session.remove()
+    stats = {"reads": 0, "writes": 0, "locked": 0, "read_latencies": [], "write_latencies": []}
+    while time.time() < start_at:
+        time.sleep(0.001)
+    while time.time() < start_at + DURATION:
+        begin = time.perf_counter()
+        write = random.random() < WRITE_RATIO
+        if write:
+            with app.app_context():
+                try:
+                    record_score(child_ids)
+                    stats["writes"] += 1
+                except OperationalError as e:
+                    db.session.rollback()
+                    if "locked" not in str(e.orig):
+                        raise
+                    stats["locked"] += 1
+        else:
+            response = client.get(f"/teacher/getChildTestRecord?child_id={random.choice(child_ids)}&limit=20")
+            if response.status_code == 500:
+                stats["locked"] += 1
+            else:
+                stats["reads"] += 1
+        stats["write_latencies" if write else "read_latencies"].append(time.perf_counter() - begin)
+    results.put(stats)
+
+
+def p99(stats, field):
+    latencies = sorted(latency for s in stats for latency in s[field])
+    return latencies[int(len(latencies) * 0.99)] * 1000 if latencies else 0
+
+
+def run(dev_name, no_wait=False):
+    db_path = copy_database()
+    # 先在主进程中执行迁移（以及 journal_mode=WAL），避免多个进程同时迁移
+    create_bench_app(dev_name, db_path=db_path, **OVERRIDES)
+    results = multiprocessing.Queue()
+    start_at = time.time() + 2
+    overrides = no_wait_overrides(dev_name) if no_wait else {}
+    processes = [multiprocessing.Process(target=worker, args=(dev_name, db_path, start_at, results, overrides))
+                 for _ in range(WORKERS)]
+    for process in processes:
+        process.start()
+    stats = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+
+    reads = sum(s["reads"] for s in stats)
+    writes = sum(s["writes"] for s in stats)
+    locked = sum(s["locked"] for s in stats)
+    label = f"{dev_name}{' busy=0' if no_wait else ''}"
+    print(f"{label:14} 读 {reads / DURATION:5.0f}/s p99 {p99(stats, 'read_latencies'):6.1f}ms  "
+          f"写 {writes / DURATION:4.0f}/s p99 {p99(stats, 'write_latencies'):6.1f}ms  "
+          f"database is locked {locked}")
+    return locked
+
+
+if __name__ == "__main__":
+    multiprocessing.set_start_method("fork")
+    print(f"{WORKERS} 个进程，每种配置 {DURATION:g} 秒，写请求占 {WRITE_RATIO:.0%}")
+    print("按配置的 busy timeout：")
+    run("develop")
+    locked = run("sqlite")
+    print("busy timeout 为0（database is locked 为锁冲突次数）：")
+    run("develop", no_wait=True)
+    run("sqlite", no_wait=True)
+    sys.exit(1 if locked else 0)
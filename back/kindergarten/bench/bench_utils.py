@@ -0,0 +1,73 @@
+import os
+import shutil
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+
+# 基准测试脚本公共部分：在数据库副本上创建app，避免改动 db/kindergarten.db
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+
+import config
+from app import create_app, db
+from sqlalchemy import event
+
+
+def copy_database():
+    """复制开发数据库到临时目录，返回副本路径"""
+    tmp_dir = tempfile.mkdtemp(prefix="kindergarten_bench_")
+    db_path = os.path.join(tmp_dir, "kindergarten.db")
+    shutil.copy(os.path.join(BASE_DIR, "db/kindergarten.db"), db_path)
+    return db_path
+
+
+def create_bench_app(dev_name="develop", db_path=None, **overrides):
+    """
+    复制开发数据库到临时目录并返回 (app, 数据库副本路径)
+    db_path：使用已有的数据库副本（多个进程共用一个副本时）
+    overrides：覆盖的配置项
+    """
+    if db_path is None:
+        db_path = copy_database()
+
+    base = config.config_map[dev_name]
+    # 缓存和登录计数也放在副本旁边，不同副本之间互不影响
+    tmp_dir = os.path.dirname(db_path)
+    attrs = {"SQLALCHEMY_DATABASE_URI": "sqlite:///" + db_path, "DEBUG": False,
+             "CACHE_SQLITE_PATH": os.path.join(tmp_dir, "cache.db"),
+             "LOGIN_LIMIT_SQLITE_PATH": os.path.join(tmp_dir, "login_limit.db")}
+    attrs.update(overrides)
+    config.config_map["bench"] = type("BenchConfig", (base,), attrs)
+    os.chdir(BASE_DIR)
+    return create_app("bench"), db_path
+
+
+@contextmanager
+def count_queries(app):
+    """统计代码块内执行的SQL语句数量"""
+    counter = {"count": 0}
+
+    def before_cursor_execute(*args):
+        counter["count"] += 1
+
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield counter
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+
+
+def timeit(func, rounds):
+    """执行 rounds 次，返回 (总耗时秒, 每秒次数)"""
+    start = time.perf_counter()
+    for _ in range(rounds):
+        func()
+    elapsed = time.perf_counter() - start
+    return elapsed, rounds / elapsed
+
+
+def login(client, phone, password):
+    return client.post("/user/login", json={"username": phone, "password": password}).get_json()
@@ -0,0 +1,29 @@
+"""
+接口SQL语句数量的回归检查：超过上限时以非0状态退出，可以放在部署前执行
+
+python bench/check_query_counts.py
+"""
+import sys
+
+from bench_utils import create_bench_app, count_queries, login
+
+app, db_path = create_bench_app()
+client = app.test_client()
+
+teacher = login(client, "13900000001", "teacher123")["data"]["uniquetoken"]
+
+# (说明, URL, 允许的最多SQL语句数)；每个接口先请求一次预热 token、体验班等缓存
+CHECKS = [
+    ("getClass", f"/teacher/getClass?teacher_id=2&uniquetoken={teacher}", 1),
+]
+
+failed = False
+for name, url, limit in CHECKS:
+    client.get(url)
+    with count_queries(app) as counter:
+        result = client.get(url).get_json()
+    ok = result["code"] == 200 and counter["count"] <= limit
+    failed = failed or not ok
+    print(f"{'OK ' if ok else 'FAIL'} {name}: {counter['count']} 条SQL（上限 {limit}），code={result['code']}")
+
+sys.exit(1 if failed else 0)
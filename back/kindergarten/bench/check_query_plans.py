@@ -0,0 +1,90 @@
+"""
+热点接口SQL的执行计划检查：记录各接口实际执行的SQL，逐条 EXPLAIN，
+带 WHERE 条件的查询出现全表扫描时以非0状态退出（不带条件的全量加载，如题库/游戏库缓存，不检查）
+
+python bench/check_query_plans.py                 # 开发库副本（SQLite）
+python bench/check_query_plans.py product         # 生产配置（MySQL，只读查询）
+"""
+import sys
+
+from sqlalchemy import event
+
+from bench_utils import create_bench_app, login
+from app import create_app, db
+
+# 关闭应用缓存，使每个接口都真正执行查询
+OVERRIDES = {"CACHE_BACKEND": "memory", "CACHE_MAX_SIZE": 0}
+
+if len(sys.argv) > 1:
+    import config
+    config.config_map["plans"] = type("PlansConfig", (config.config_map[sys.argv[1]],), OVERRIDES)
+    app = create_app("plans")
+else:
+    app, db_path = create_bench_app(**OVERRIDES)
+client = app.test_client()
+
+statements = []
+
+
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    words = statement.upper().split()
+    if words and words[0] == "SELECT" and "WHERE" in words:
+        statements.append((statement, parameters))
+
+
+with app.app_context():
+    engine = db.engine
+event.listen(engine, "before_cursor_execute", before_cursor_execute)
+
+parent = login(client, "13800000001", "parent123")["data"]
+teacher = login(client, "13900000001", "teacher123")["data"]["uniquetoken"]
+admin = login(client, "13800000000", "admin123")["data"]["uniquetoken"]
+t = f"teacher_id=2&uniquetoken={teacher}"
+a = f"manager_id=1&uniquetoken={admin}"
+for url in [
+    f"/teacher/getClass?{t}",
+    f"/teacher/getClassChild?class_id=2&{t}",
+    f"/teacher/getClassTestAge?class_id=2&{t}",
+    "/teacher/getChildTestRecord?child_id=1&limit=1",
+    f"/teacher/getTestDetail?dq_id=1&{t}",
+    f"/admin/classDetail?class_id=2&{a}",
+    f"/admin/childDetail?child_id=1&{a}",
+    f"/admin/teacherDetail?teacher_id=2&{a}",
+]:
+    client.get(url)
+client.post("/teacher/test", json={"child_id": 1, "teacher_id": 2, "uniquetoken": teacher})
+event.remove(engine, "before_cursor_execute", before_cursor_execute)
+
+# 按条件直接查询题库/游戏库（数据导入核对等场景）
+statements += [
+    ("SELECT quiz_id FROM QuizInfo WHERE month_age = 12 AND sort = 1", ()),
+    ("SELECT game_id FROM Game WHERE game_sort = 1 AND game_beginTime <= 12 AND game_endTime >= 12", ()),
+    ("SELECT dq_id FROM TestDetail WHERE quiz_id = 30", ()),
+]
+
+
+def full_scans(conn, statement, parameters):
+    """返回全表扫描的表名列表"""
+    if engine.dialect.name == "sqlite":
+        rows = conn.exec_driver_sql("EXPLAIN QUERY PLAN " + statement, parameters).all()
+        # SEARCH 表示使用索引或主键定位；SCAN 表示逐行扫描整张表（或整个索引）
+        return [row[-1] for row in rows if row[-1].startswith("SCAN ")]
+    result = conn.exec_driver_sql("EXPLAIN " + statement, parameters)
+    columns = list(result.keys())
+    return [row[columns.index("table")] for row in result.all() if row[columns.index("type")] == "ALL"]
+
+
+failed = False
+seen = set()
+with engine.connect() as conn:
+    for statement, parameters in statements:
+        if statement in seen:
+            continue
+        seen.add(statement)
+        scans = full_scans(conn, statement, parameters)
+        failed = failed or bool(scans)
+        print(f"{'FAIL' if scans else 'OK  '} {' '.join(statement.split())[:110]}")
+        for scan in scans:
+            print(f"       全表扫描: {scan}")
+
+sys.exit(1 if failed else 0)
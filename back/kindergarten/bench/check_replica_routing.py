@@ -0,0 +1,83 @@
+"""
+只读副本路由检查：主库和只读副本分别是开发库的两个SQLite副本，
+副本中把 1 号学生的测评分数改成 -1，根据返回的分数和各库执行的SQL判断查询走了哪个库，任一检查不通过时以非0状态退出
+
+python bench/check_replica_routing.py
+"""
+import shutil
+import sys
+import time
+
+from sqlalchemy import event, text
+
+from bench_utils import copy_database, create_bench_app, login
+from app import db
+
+STICKY = 1
+primary_path = copy_database()
+replica_path = primary_path.replace("kindergarten.db", "replica.db")
+app, _ = create_bench_app(db_path=primary_path, REPLICA_STICKY_SECONDS=STICKY,
+                          SQLALCHEMY_BINDS={"replica": "sqlite:///" + replica_path})
+# 迁移在主库上执行后再复制，相当于副本已经同步
+shutil.copy(primary_path, replica_path)
+
+executed = {"primary": [], "replica": []}
+with app.app_context():
+    engines = {"primary": db.engines[None], "replica": db.engines["replica"]}
+    with engines["replica"].begin() as conn:
+        conn.execute(text("UPDATE Dq SET dq = -1 WHERE child_id = 1"))
+for name, engine in engines.items():
+    event.listen(engine, "before_cursor_execute",
+                 lambda conn, cursor, statement, *args, name=name: executed[name].append(statement))
+
+teacher_client = app.test_client()
+teacher_client.environ_base["REMOTE_ADDR"] = "10.0.0.1"
+other_client = app.test_client()
+other_client.environ_base["REMOTE_ADDR"] = "10.0.0.2"
+admin_client = app.test_client()
+admin_client.environ_base["REMOTE_ADDR"] = "10.0.0.3"
+
+failed = False
+
+
+def check(description, ok):
+    global failed
+    failed = failed or not ok
+    print(f"{'OK  ' if ok else 'FAIL'} {description}")
+
+
+def record_source(client):
+    data = client.get("/teacher/getChildTestRecord?child_id=1").get_json()["data"]
+    return "replica" if data and data[0]["dq"] == -1 else "primary"
+
+
+teacher = login(teacher_client, "13900000001", "teacher123")["data"]["uniquetoken"]
+check("登录（写入token）走主库", not any(s.upper().startswith("UPDATE") for s in executed["replica"]))
+check("写入后 REPLICA_STICKY_SECONDS 内同一IP读主库", record_source(teacher_client) == "primary")
+check("其他用户读副本", record_source(other_client) == "replica")
+time.sleep(STICKY + 0.2)
+check("超过 REPLICA_STICKY_SECONDS 后读副本", record_source(teacher_client) == "replica")
+
+executed["replica"].clear()
+response = teacher_client.get(f"/teacher/getTestDetail?dq_id=1&teacher_id=2&uniquetoken={teacher}")
+check("getTestDetail 鉴权走主库、详情查询走副本",
+      response.get_json()["code"] == 200 and not any("token" in s for s in executed["replica"])
+      and any("TestDetail" in s for s in executed["replica"]))
+
+admin = login(admin_client, "13800000000", "admin123")["data"]["uniquetoken"]
+time.sleep(STICKY + 0.2)
+executed["replica"].clear()
+response = admin_client.get(f"/admin/getChildInfo?manager_id=1&uniquetoken={admin}")
+check("getChildInfo 走副本并带 ETag", bool(executed["replica"]) and response.headers.get("ETag") is not None)
+
+# 其他用户修改学生后，副本可能还没同步：复制延迟时间内副本的响应不带 ETag
+with app.test_request_context():
+    from app.versions import bump_version
+    bump_version("child")
+response = admin_client.get(f"/admin/getChildInfo?manager_id=1&uniquetoken={admin}")
+check("学生表刚修改时副本的响应不带 ETag", response.headers.get("ETag") is None)
+
+check("副本上没有执行写语句",
+      not any(s.split()[0].upper() in ("INSERT", "UPDATE", "DELETE") for s in executed["replica"]))
+
+sys.exit(1 if failed else 0)
@@ -49,3 +49,4 @@ cursor.close()
 conn.close()
 
 print("数据插入完成！")
+print("服务运行中时请调用 POST /admin/reloadCatalog 刷新游戏库缓存")
@@ -22,3 +22,4 @@ cursor.close()
 conn.close()
 
 print("数据插入完成！")
+print("服务运行中时请调用 POST /admin/reloadCatalog 刷新题库缓存")
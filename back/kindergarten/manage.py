@@ -1,7 +1,10 @@
+import os
+
 from app import create_app, db
 from flask_cors import CORS
 
-app = create_app("develop")
+# 配置名见 config.config_map，默认 develop；单机SQLite部署使用 KINDERGARTEN_CONFIG=sqlite
+app = create_app(os.environ.get("KINDERGARTEN_CONFIG", "develop"))
 
 # 用CORS（跨域资源共享）支持，允许跨域请求
 CORS(app, resources={r'/*': {'origins': '*'}}, supports_credentials=True)
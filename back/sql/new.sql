@@ -3,4 +3,6 @@ ADD COLUMN token VARCHAR(512) NULL;
 ALTER TABLE Teacher
 ADD COLUMN token VARCHAR(512) NULL;
 ALTER TABLE Parent
-ADD COLUMN token VARCHAR(512) NULL;
\ No newline at end of file
+ADD COLUMN token VARCHAR(512) NULL;
+-- 之后的表结构变更（ChildLatestDq 表、热点查询索引等）改为版本化迁移，见 kindergarten/app/migrations.py：
+--   flask --app manage.py migrate